@@ -5,9 +5,10 @@ from sqlalchemy import select
 
 from app import db
 from app.consts import SleepStatus
-from app.device.logic.display import clear_display, update_display
+from app.device.logic.display import clear_display, prerender_display, update_display
 from app.device.logic.queue import shift_next, shuffle_queue
 from app.device.models import DeviceModel
+from app.frame.cache import get_prerender_minutes
 from app.schedule.logic import get_status, set_status, should_sleep_now
 
 
@@ -48,6 +49,29 @@ def tick_all_devices() -> None:
 		tick_device(device.id)
 
 
+# Meant to run between ticks, so the render work of the next minutes is spread out
+# and the tick itself only publishes cached frames
+def prerender_device(device_id: int) -> None:
+	model: DeviceModel | None = db.session.get(DeviceModel, device_id)
+	if model is None:
+		return
+		
+	if not model.is_enabled:
+		return
+	
+	if should_sleep_now(device_id):
+		return
+	
+	logger.info(f"prerendering device ({device_id}) frames")
+	prerender_display(device_id, get_prerender_minutes())
+
+
+def prerender_all_devices() -> None:
+	devices: Sequence[DeviceModel] = db.session.scalars(select(DeviceModel)).all()
+	for device in devices:
+		prerender_device(device.id)
+
+
 def shuffle_device_queue(device_id: int) -> None:
 	model: DeviceModel | None = db.session.get(DeviceModel, device_id)
 	if model is None:
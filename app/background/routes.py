@@ -3,7 +3,7 @@ from flask_restx import Resource
 from app.lib.decorators import local_apikey_required
 
 from . import ns
-from .logic import shift_all_device_queue, shift_device_queue, shuffle_all_device_queue, shuffle_device_queue, tick_all_devices, tick_device
+from .logic import prerender_all_devices, prerender_device, shift_all_device_queue, shift_device_queue, shuffle_all_device_queue, shuffle_device_queue, tick_all_devices, tick_device
 
 @ns.route("/tick-all")
 class TickAllDeviceRes(Resource):
@@ -28,6 +28,29 @@ class TickDeviceRes(Resource):
 		return "", 204
 
 
+@ns.route("/prerender-all")
+class PrerenderAllDeviceRes(Resource):
+	@local_apikey_required
+	@ns.response(204, "Success")
+	def post(self):
+		
+		prerender_all_devices()
+		
+		return "", 204
+		
+
+@ns.route("/prerender/<int:device_id>")
+@ns.param("device_id", "Device ID")
+class PrerenderDeviceRes(Resource):
+	@local_apikey_required
+	@ns.response(204, "Success")
+	def post(self, device_id: int):
+				
+		prerender_device(device_id)
+		
+		return "", 204
+
+
 @ns.route("/next-all")
 class ShiftAllDeviceRes(Resource):
 	@local_apikey_required
@@ -18,6 +18,7 @@ REDIS CONSTS
 #R_CH_PUB: str = "epdpi"
 R_CH_DRAW: str = "epdpi_draw"
 R_CH_CLEAR: str = "epdpi_clear"
+R_CH_DELTA: str = "epdpi_delta"
 
 #R_MSG_CLEAR: str = "clear"
 #R_MSG_DRAW: str = "draw"
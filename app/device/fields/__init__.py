@@ -1,6 +1,9 @@
 from flask_restx import fields
 
 from .. import ns
+from app.frame.consts import FrameCodec
+from app.wallpaper.consts import DitherMethod
+
 from ..consts import Orientation
 
 device_fields = ns.model("Device", {
@@ -19,6 +22,9 @@ device_fields = ns.model("Device", {
 	"isDrawGrid":			fields.Boolean(description="Is draw grid on screen?"),
 	"isEnabled":			fields.Boolean(description="Is device enabled?"),
 	"isShowTime":			fields.Boolean(description="Is show time?"),
+	"ditherMethod":			fields.String(description="Dithering algorithm used when processing wallpapers", enum=[dm.value for dm in DitherMethod]),
+	"isDeltaEnabled":		fields.Boolean(description="Is the display updated with delta frames?"),
+	"supportedCodecs":		fields.List(fields.String(enum=[fc.name for fc in FrameCodec]), description="Frame codecs the device decodes, in order of preference"),
 })
 
 
@@ -31,6 +37,9 @@ device_update_fields = ns.model("DeviceUpdate", {
 	"isDrawGrid":	fields.Boolean(description="Is draw grid on screen?"),
 	"isEnabled":	fields.Boolean(description="Is device enabled?"),
 	"isShowTime":			fields.Boolean(description="Is show time?"),
+	"ditherMethod":	fields.String(description="Dithering algorithm used when processing wallpapers", enum=[dm.value for dm in DitherMethod]),
+	"isDeltaEnabled":	fields.Boolean(description="Is the display updated with delta frames?"),
+	"supportedCodecs":	fields.List(fields.String(enum=[fc.name for fc in FrameCodec]), description="Frame codecs the device decodes, in order of preference"),
 })
 
 
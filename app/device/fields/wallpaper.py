@@ -1,5 +1,7 @@
 from flask_restx import fields
 
+from app.wallpaper.consts import JobStatus
+
 from .. import ns
 
 
@@ -26,3 +28,16 @@ wallpaper_update_fields = ns.model("WallpaperUpdate", {
 	"color": 		fields.String(),
 	"shadow": 		fields.String()
 })
+
+
+wallpaper_job_fields = ns.model("WallpaperJob", {
+	"id":			fields.String(description="Job ID"),
+	"deviceId":		fields.Integer(description="Device ID"),
+	"status":		fields.String(description="Job status", enum=[js.value for js in JobStatus]),
+	"done":			fields.Integer(description="Number of images processed so far"),
+	"total":		fields.Integer(description="Number of images to process, files reusing a stored wallpaper are not processed"),
+	"createdAt":	fields.DateTime(description="Time the job was submitted"),
+	"finishedAt":	fields.DateTime(description="Time the job finished"),
+	"result":		fields.Raw(description="Result of a done job, e.g. {\"wallpaperId\": 1}, or {\"files\": [...]} for a batch"),
+	"error":		fields.String(description="Reason a failed job failed"),
+})
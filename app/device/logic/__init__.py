@@ -1,5 +1,3 @@
-import os
-
 from datetime import datetime
 from logging import Logger, getLogger
 from typing import Sequence
@@ -8,10 +6,13 @@ from pytz import timezone
 from sqlalchemy import delete, exists, select
 
 from app import db
-from app.consts import DIR_APP_UPLOAD
+from app.frame.cache import invalidate_device_frames
+from app.frame.delta import forget_device
 from app.lib.errors import api_abort, ErrorCode
 from app.schedule.models import ScheduleModel, ScheduleOwnershipModel
+from app.wallpaper.consts import DitherMethod
 from app.wallpaper.models import WallpaperModel, WallpaperOwnershipModel
+from app.wallpaper.store import release_files
 
 from ..consts import *
 from ..models import DeviceModel, DeviceOwnershipModel
@@ -165,6 +166,24 @@ def update_device(user_id: int, device_id: int, payload: dict) -> dict:
 	is_show_time: bool | None = payload.get("isShowTime")
 	if is_show_time is not None:
 		model.is_show_time = is_show_time
+	
+	is_delta_enabled: bool | None = payload.get("isDeltaEnabled")
+	if is_delta_enabled is not None:
+		model.is_delta_enabled = is_delta_enabled
+	
+	supported_codecs: list[str] | None = payload.get("supportedCodecs")
+	if supported_codecs is not None:
+		if (err := is_supported_codecs_valid(supported_codecs)) is not None:
+			failed_validations["supportedCodecs"] = err
+		else:
+			model.supported_codecs = supported_codecs
+	
+	dither_method: str | None = payload.get("ditherMethod")
+	if dither_method is not None:
+		if (err := is_dither_method_valid(dither_method)) is not None:
+			failed_validations["ditherMethod"] = err
+		else:
+			model.dither_method = DitherMethod[dither_method]
 				
 	if len(failed_validations.values()) > 0:
 		db.session.rollback()
@@ -179,6 +198,9 @@ def update_device(user_id: int, device_id: int, payload: dict) -> dict:
 		logger.error(f"DB commit failed: {ex}")
 		api_abort(ErrorCode.DATABASE_ERROR)
 
+	# device settings are part of every rendered frame
+	invalidate_device_frames(device_id)
+
 	return model.to_dict()
 	
 
@@ -225,12 +247,10 @@ def delete_device(device_id: int) -> None:
 		logger.error(f"DB commit failed: {ex}")
 		api_abort(ErrorCode.DATABASE_ERROR)
 	
-	# Clean up associated files
-	for file_name in file_names:
-		file_path: str = os.path.join(DIR_APP_UPLOAD, file_name)
-
-		try:
-			logger.info(f"Deleting file {file_path}")
-			os.remove(file_path)
-		except Exception as ex:
-			logger.error(f"Unable to delete file: {ex}")
+	# Drop its cached frames and the last frame deltas are computed against, a device
+	# created later with the same ID starts clean
+	invalidate_device_frames(device_id)
+	forget_device(device_id)
+	
+	# Clean up associated files, unless wallpapers of other devices share them
+	release_files(file_names)
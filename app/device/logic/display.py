@@ -1,14 +1,18 @@
 import base64
 import os
-import zlib
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from logging import Logger, getLogger
 
 from app import db, redis_controller
 from app.consts import *
 from app.device.logic import can_access_device
 from app.epd7in3e.consts import SupportedColors
+from app.frame.cache import get_frame, get_redis_ttl, make_frame_key, put_frame, track_device_frame
+from app.frame.codecs import decode_frame, encode_frame, negotiate_codec
+from app.frame.consts import FrameCodec, FrameFormat
+from app.frame.delta import forget_device, next_delta
+from app.frame.envelope import is_binary_transport_enabled, pack_envelope
 from app.lib.errors import api_abort, ErrorCode
 from app.wallpaper.models import WallpaperModel
 
@@ -17,65 +21,200 @@ from ..models import DeviceModel
 logger: Logger = getLogger(__name__)
 
 
-def update_display(device_id: int, is_save_img: bool = False) -> None:
-	logger.info(f"{device_id=} {is_save_img=}")
-	
-	device: DeviceModel | None = db.session.get(DeviceModel, device_id)
-
-	if device is None:
-		api_abort(ErrorCode.DEVICE_NOT_FOUND)
-		
+def _get_display_wallpaper(device: DeviceModel) -> WallpaperModel | None:
 	current_wallpaper_id: int = 0 if len(device.queue) == 0 else device.queue[0]
 	wallpaper: WallpaperModel | None = db.session.get(WallpaperModel, current_wallpaper_id)
 	if wallpaper is None:
 		logger.error(f"Unable to find wallpaper resource ({current_wallpaper_id=})")
-		return
+		return None
 
 	file_path: str = os.path.join(DIR_APP_UPLOAD, wallpaper.file_name)
 	if not os.path.isfile(file_path):
 		logger.error(f"Unable to find wallpaper file: {file_path}")
-		return
+		return None
+
+	# layouts are dropped when the device size changes, resolve and keep it again
+	if not wallpaper.has_label_layout():
+		wallpaper.update_label_layout(device.type, device.width, device.height)
+		try:
+			db.session.commit()
+		except Exception as ex:
+			db.session.rollback()
+			logger.error(f"DB commit failed: {ex}")
+			return None
+
+	if not wallpaper.has_label_layout():
+		logger.error(f"Missing label layout")
+		return None
+
+	return wallpaper
+
 
-	time: str = f"{datetime.now().hour:02d}:{datetime.now().minute:02d}"
-	x: float | None = wallpaper.label_x_per	# time label x position (anchor: top left)
-	y: float | None = wallpaper.label_y_per	# time label y position (anchor: top left)
-	w: float | None = wallpaper.label_w_per	# time label width (percentage of canvas width)
-	h: float | None = wallpaper.label_h_per	# time label height (percentage of canvas height)
-	width: int = device.width
-	height: int = device.height
+def _format_time(dt: datetime) -> str:
+	return f"{dt.hour:02d}:{dt.minute:02d}"
+
+
+# Build the packed frame for wallpaper at time, encoded with the device's codec, from the frame cache when
+# the same frame was already rendered.
+# redis_ttl overrides how long the frame is kept in the redis tier.
+def build_frame(
+	device: DeviceModel,
+	wallpaper: WallpaperModel,
+	time: str,
+	is_save_img: bool = False,
+	redis_ttl: int | None = None
+) -> bytes:
+	file_path: str = os.path.join(DIR_APP_UPLOAD, wallpaper.file_name)
 	color: str = wallpaper.color if device.is_show_time else SupportedColors.NONE.value
 	shadow: str = wallpaper.shadow if device.is_show_time else SupportedColors.NONE.value
 	is_draw_grids: bool = device.is_draw_grid
+	font_size: int = wallpaper.label_font_size
+	anchor: tuple[int, int] = (wallpaper.label_anchor_x, wallpaper.label_anchor_y)	# time label pixel position (anchor: top left)
+	shadow_offset: tuple[float, float] = (wallpaper.label_shadow_x, wallpaper.label_shadow_y)	# shadow position relative to the label
+	codec: FrameCodec = negotiate_codec(device.supported_codecs)
 	
-	if x is None or y is None or w is None or h is None:
-		logger.error(f"Missing required argument")
-		return
+	# same frame already rendered (refresh + tick, prerendered, or another device)
+	frame_key: str = make_frame_key(
+		wallpaper.id,
+		wallpaper.updated_at,
+		time,
+		color,
+		shadow,
+		is_draw_grids,
+		device.type,
+		device.width,
+		device.height,
+		device.orientation.value,
+		codec,
+	)
+	track_device_frame(device.id, frame_key)
 	
-	data: str = ""
-	if device.type == "epd7in3e":
-		from app.epd7in3e.logic import process_image, convert_image_to_buffer
+	data: bytes = b"" if is_save_img else get_frame(frame_key) or b""
+	if len(data) > 0:
+		logger.debug(f"Frame cache hit {frame_key=}")
+	elif device.type == "epd7in3e":
+		from app.epd7in3e.logic import process_buffer, process_image, convert_image_to_buffer
+		
+		if is_save_img:
+			image = process_image(file_path, time, font_size, anchor, shadow_offset, color, shadow, is_draw_grids)
+			buffer: bytes = convert_image_to_buffer(image)
+			
+			test_img_file_path: str = os.path.join(DIR_TEST_IMG, f"{os.path.splitext(wallpaper.file_name)[0]}.bmp")
+			logger.info(f"Saving test image: {test_img_file_path}")
+			image.save(test_img_file_path)
+		else:
+			# only the bytes under the label are rewritten in the cached packed wallpaper
+			buffer = process_buffer(file_path, time, font_size, anchor, shadow_offset, color, shadow, is_draw_grids)
 		
-		image = process_image(file_path, time, x, y, w, h, width, height, color, shadow, is_draw_grids)
-		buffer: list[int] = convert_image_to_buffer(image)
-		compressed_bytes: bytes = zlib.compress(bytes(buffer))
-		data = base64.b64encode(compressed_bytes).decode("utf-8")
+		data = encode_frame(codec, buffer)
 		
-		logger.debug(f"{len(image.tobytes())=}")
 		logger.debug(f"{len(buffer)=}")
-		logger.debug(f"{len(compressed_bytes)=}")
 		logger.debug(f"{len(data)=}")
-		#logger.debug((compressed_bytes))
 		
-		if is_save_img:
-			test_img_file_path: str = os.path.join(DIR_TEST_IMG, f"{wallpaper.file_name}")
-			logger.info(f"Saving test image: {test_img_file_path}")
-			image.save(test_img_file_path)
+		put_frame(frame_key, data, redis_ttl)
+	
+	return data
+
+
+def update_display(device_id: int, is_save_img: bool = False) -> None:
+	logger.info(f"{device_id=} {is_save_img=}")
+	
+	device: DeviceModel | None = db.session.get(DeviceModel, device_id)
+
+	if device is None:
+		api_abort(ErrorCode.DEVICE_NOT_FOUND)
+		
+	wallpaper: WallpaperModel | None = _get_display_wallpaper(device)
+	if wallpaper is None:
+		return
+
+	data: bytes = build_frame(device, wallpaper, _format_time(datetime.now()), is_save_img)
 	
 	if len(data) == 0:
 		logger.error(f"Empty byte array")
 		return
 
-	redis_controller.rpublish(f"{R_CH_DRAW}_{device.ipv4}", data)
+	publish_frame(device, data)
+	
+	# off the tick that was just sent, so the next wallpaper is ready when the queue moves
+	_prefetch_next_wallpaper(device)
+
+
+def _prefetch_next_wallpaper(device: DeviceModel) -> None:
+	if len(device.queue) < 2:
+		return
+	
+	wallpaper: WallpaperModel | None = db.session.get(WallpaperModel, device.queue[1])
+	if wallpaper is None:
+		return
+	
+	if device.type == "epd7in3e":
+		from app.epd7in3e.logic import prefetch_wallpaper
+		prefetch_wallpaper(os.path.join(DIR_APP_UPLOAD, wallpaper.file_name), device.is_draw_grid)
+
+
+# Packed frame format (width, height, bits per pixel) of the device's panel
+def _get_panel_format(device: DeviceModel) -> tuple[int, int, int] | None:
+	if device.type == "epd7in3e":
+		from app.epd7in3e.consts import EPD_BPP, EPD_DIMENSIONS
+		return EPD_DIMENSIONS[0], EPD_DIMENSIONS[1], EPD_BPP
+	
+	return None
+
+
+# Send the encoded frame to the device, as a delta of the previous frame when the
+# device takes delta frames. Keyframes go out on the regular draw channel.
+def publish_frame(device: DeviceModel, data: bytes) -> None:
+	panel_format: tuple[int, int, int] | None = _get_panel_format(device)
+	codec: FrameCodec = negotiate_codec(device.supported_codecs)
+	if not device.is_delta_enabled or panel_format is None:
+		forget_device(device.id)
+		_publish(device, R_CH_DRAW, FrameFormat.FULL, panel_format, codec, data)
+		return
+	
+	buffer: bytes = decode_frame(codec, data)
+	payload: bytes | None = next_delta(device.id, buffer, *panel_format)
+	
+	if payload is None:
+		logger.debug(f"Publishing keyframe {device.id=}")
+		_publish(device, R_CH_DRAW, FrameFormat.FULL, panel_format, codec, data)
+	elif len(payload) == 0:
+		logger.debug(f"Frame unchanged, nothing to publish {device.id=}")
+	else:
+		logger.debug(f"Publishing delta {device.id=} {len(payload)=}")
+		_publish(device, R_CH_DELTA, FrameFormat.DELTA, panel_format, codec, encode_frame(codec, payload))
+
+
+# Raw bytes in a binary envelope, or base64 text for panels on the text transport
+def _publish(device: DeviceModel, channel: str, format: FrameFormat, panel_format: tuple[int, int, int] | None, codec: FrameCodec, body: bytes) -> None:
+	if is_binary_transport_enabled() and panel_format is not None:
+		redis_controller.rpublish_bytes(f"{channel}_{device.ipv4}", pack_envelope(format, *panel_format, codec, body))
+	else:
+		redis_controller.rpublish(f"{channel}_{device.ipv4}", base64.b64encode(body).decode("utf-8"))
+
+
+def prerender_display(device_id: int, minutes: int) -> int:
+	logger.info(f"{device_id=} {minutes=}")
+	
+	device: DeviceModel | None = db.session.get(DeviceModel, device_id)
+
+	if device is None:
+		api_abort(ErrorCode.DEVICE_NOT_FOUND)
+		
+	wallpaper: WallpaperModel | None = _get_display_wallpaper(device)
+	if wallpaper is None:
+		return 0
+	
+	now: datetime = datetime.now()
+	count: int = 0
+	for minute in range(1, minutes + 1):
+		# keep the frame in redis until its minute has passed
+		redis_ttl: int = get_redis_ttl() + minute * 60
+		data: bytes = build_frame(device, wallpaper, _format_time(now + timedelta(minutes=minute)), redis_ttl=redis_ttl)
+		if len(data) > 0:
+			count += 1
+	
+	return count
 
 
 def clear_display(device_id: int) -> None:
@@ -86,4 +225,7 @@ def clear_display(device_id: int) -> None:
 	if device is None:
 		api_abort(ErrorCode.DEVICE_NOT_FOUND)
 		
+	# the panel no longer shows the last frame, start over with a keyframe
+	forget_device(device.id)
+	
 	redis_controller.rpublish(f"{R_CH_CLEAR}_{device.ipv4}", "clear")
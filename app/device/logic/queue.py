@@ -6,6 +6,7 @@ from pytz import timezone
 
 from app import db
 from app.consts import *
+from app.frame.cache import invalidate_device_frames
 from app.lib.errors import api_abort, ErrorCode
 
 from ..models import DeviceModel
@@ -42,6 +43,9 @@ def shift_next(device_id: int) -> None:
 		logger.error(f"DB commit failed: {ex}")
 		api_abort(ErrorCode.DATABASE_ERROR)
 	
+	# frames prerendered for the previous queue head are no longer shown
+	invalidate_device_frames(device_id)
+	
 	logger.info(f"Queue shifted")
 
 
@@ -69,6 +73,9 @@ def shuffle_queue(device_id: int) -> None:
 		logger.error(f"DB commit failed: {ex}")
 		api_abort(ErrorCode.DATABASE_ERROR)		
 	
+	# frames prerendered for the previous queue head are no longer shown
+	invalidate_device_frames(device_id)
+	
 	logger.info(f"Queue shuffled: {device.queue}")
 
 
@@ -100,6 +107,35 @@ def append_to_queue(device_id: int, wallpaper_id: int) -> None:
 	logger.info(f"Queue appended: {device.queue}")
 
 
+# Same as append_to_queue for several wallpapers, with a single commit
+def append_all_to_queue(device_id: int, wallpaper_ids: list[int]) -> None:
+	logger.info(f"Attempting to append {wallpaper_ids} to queue")
+
+	device: DeviceModel | None = db.session.get(DeviceModel, device_id)
+	
+	if device is None:
+		api_abort(ErrorCode.DEVICE_NOT_FOUND)
+		
+	queue: list[int] = device.queue
+	for wallpaper_id in wallpaper_ids:
+		if wallpaper_id in queue:
+			logger.warning(f"Duplicate id: {wallpaper_id}")
+			continue
+		
+		queue.append(wallpaper_id)
+	
+	device.updated_at = datetime.now(timezone("Asia/Singapore"))
+	
+	try:
+		db.session.commit()
+	except Exception as ex:
+		db.session.rollback()
+		logger.error(f"DB commit failed: {ex}")
+		api_abort(ErrorCode.DATABASE_ERROR)
+	
+	logger.info(f"Queue appended: {device.queue}")
+
+
 def move_to_first(device_id: int, wallpaper_id: int) -> None:
 	logger.info(f"Attempting to move {wallpaper_id} to front of queue")
 
@@ -130,6 +166,9 @@ def move_to_first(device_id: int, wallpaper_id: int) -> None:
 		logger.error(f"DB commit failed: {ex}")
 		api_abort(ErrorCode.DATABASE_ERROR)
 		
+	# frames prerendered for the previous queue head are no longer shown
+	invalidate_device_frames(device_id)
+	
 	logger.info(f"Moved {wallpaper_id} to front of queue")
 	
 
@@ -150,6 +189,9 @@ def remove_all_from_queue(device_id: int) -> None:
 		logger.error(f"DB commit failed: {ex}")
 		api_abort(ErrorCode.DATABASE_ERROR)
 
+	# frames prerendered for the previous queue head are no longer shown
+	invalidate_device_frames(device_id)
+	
 	logger.info(f"Removed all from queue")
 
 
@@ -182,4 +224,7 @@ def remove_from_queue(device_id: int, wallpaper_id: int) -> None:
 		logger.error(f"DB commit failed: {ex}")
 		api_abort(ErrorCode.DATABASE_ERROR)
 
+	# frames prerendered for the previous queue head are no longer shown
+	invalidate_device_frames(device_id)
+	
 	logger.info(f"Removed {wallpaper_id} from queue")
@@ -1,12 +1,14 @@
 from datetime import datetime
 from pytz import timezone
 
-from sqlalchemy import ARRAY, Boolean, ForeignKey, Integer, String, Boolean, DateTime, UniqueConstraint
+from sqlalchemy import ARRAY, Boolean, ForeignKey, Integer, String, Boolean, DateTime, UniqueConstraint, select, update
 from sqlalchemy.dialects.postgresql import ENUM
 from sqlalchemy.ext.mutable import MutableList
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app import db
+from app.frame.consts import DEFAULT_FRAME_CODEC
+from app.wallpaper.consts import DEFAULT_DITHER_METHOD, DitherMethod
 
 from .consts import Orientation
 
@@ -29,6 +31,9 @@ class DeviceModel(db.Model):
 	is_draw_grid: Mapped[bool]			= mapped_column(Boolean, nullable=False, default=False, server_default="f")
 	is_show_time: Mapped[bool]			= mapped_column(Boolean, nullable=False, default=True, server_default="t")
 	is_enabled: Mapped[bool]			= mapped_column(Boolean, nullable=False, default=True, server_default="t")
+	dither_method: Mapped[DitherMethod]	= mapped_column(ENUM(DitherMethod), nullable=False, server_default=DEFAULT_DITHER_METHOD.value)
+	is_delta_enabled: Mapped[bool]		= mapped_column(Boolean, nullable=False, default=False, server_default="f")
+	supported_codecs: Mapped[list[str]] = mapped_column(MutableList.as_mutable(ARRAY(String)), default=list, nullable=False, server_default=f"{{{DEFAULT_FRAME_CODEC.name}}}")
 	created_at:	Mapped[datetime]		= mapped_column(DateTime, nullable=False, default=datetime.now(timezone("Asia/Singapore")))
 	updated_at:	Mapped[datetime] 		= mapped_column(DateTime, nullable=True)
 
@@ -47,6 +52,9 @@ class DeviceModel(db.Model):
 		self.is_draw_grid = False
 		self.is_enabled = True
 		self.is_show_time = True
+		self.dither_method = DEFAULT_DITHER_METHOD
+		self.is_delta_enabled = False
+		self.supported_codecs = [DEFAULT_FRAME_CODEC.name]
 		
 		self.update_orientation(orientation)
 		self.update_colors()
@@ -65,6 +73,9 @@ class DeviceModel(db.Model):
 			is_draw_grid:{self.is_draw_grid} \
 			is_enabled:{self.is_enabled} \
 			is_show_time:{self.is_show_time} \
+			dither_method:{self.dither_method.value} \
+			is_delta_enabled:{self.is_delta_enabled} \
+			supported_codecs:{self.supported_codecs} \
 			created_at:{self.created_at} \
 			updated_at:{self.updated_at} \
 			>"
@@ -84,10 +95,14 @@ class DeviceModel(db.Model):
 			"isDrawGrid": self.is_draw_grid,
 			"isEnabled": self.is_enabled,
 			"isShowTime": self.is_show_time,
+			"ditherMethod": self.dither_method.value,
+			"isDeltaEnabled": self.is_delta_enabled,
+			"supportedCodecs": self.supported_codecs,
 		}
 	
 	def update_orientation(self, orientation: Orientation) -> None:
 		self.orientation = orientation
+		self.clear_label_layouts()
 		
 		if self.type == "epd7in3e":
 			from app.epd7in3e.consts import EPD_DIMENSIONS
@@ -106,6 +121,24 @@ class DeviceModel(db.Model):
 		self.update_orientation(self.orientation)
 		self.update_colors()
 	
+	# Stored wallpaper label layouts depend on the device size, drop them so they are
+	# resolved again on the next display update
+	def clear_label_layouts(self) -> None:
+		if self.id is None:
+			return
+
+		from app.wallpaper.models import WallpaperModel, WallpaperOwnershipModel
+		stmt = update(WallpaperModel).where(
+			WallpaperModel.id.in_(select(WallpaperOwnershipModel.wallpaper_id).where(WallpaperOwnershipModel.device_id == self.id))
+		).values(
+			label_font_size=None,
+			label_anchor_x=None,
+			label_anchor_y=None,
+			label_shadow_x=None,
+			label_shadow_y=None,
+		)
+		db.session.execute(stmt, execution_options={"synchronize_session": "fetch"})
+
 	def update_colors(self) -> None:
 		if self.type == "epd7in3e":
 			from app.epd7in3e.consts import SupportedColors, DEFAULT_LABEL_COLOR, DEFAULT_LABEL_SHADOW
@@ -1,14 +1,20 @@
+import os
+
+from io import BytesIO
 from logging import Logger, getLogger
 
-from flask import session, request, send_from_directory
+from flask import current_app, session, request, send_file, send_from_directory
 from flask_restx import Resource, reqparse
 
 from app import api
 from app.consts import DIR_APP_UPLOAD
 from app.device.logic import can_access_device
+from app.frame.packed import is_packed_file, read_packed_image
 from app.lib.decorators import admin_required, login_required, local_apikey_required
 from app.lib.errors import ErrorCode, api_abort
-from app.wallpaper.logic import can_access_wallpaper, create_wallpaper, delete_all_wallpaper, delete_wallpaper, update_wallpaper, get_wallpapers, get_wallpaper_name
+from app.wallpaper.consts import DEFAULT_BACKGROUND_FILL, DEFAULT_BATCH_MAX_CONTENT_LENGTH, BackgroundFill
+from app.wallpaper.jobs import get_job
+from app.wallpaper.logic import can_access_wallpaper, create_wallpaper, create_wallpapers, delete_all_wallpaper, delete_wallpaper, update_wallpaper, get_wallpapers, get_wallpaper_name
 
 from .. import ns
 from ..fields import *
@@ -26,6 +32,15 @@ upload_parser = upload_parser.add_argument("file", location="files", type="FileS
 upload_parser = upload_parser.add_argument("imgScalePer", type=str, location="form", required=True)
 upload_parser = upload_parser.add_argument("xPosPer", type=str, location="form", required=True)
 upload_parser = upload_parser.add_argument("yPosPer", type=str, location="form", required=True)
+upload_parser = upload_parser.add_argument("bgFill", type=str, location="form", required=False, choices=[bf.value for bf in BackgroundFill], default=DEFAULT_BACKGROUND_FILL.value)
+
+# placement fields are given once for all files, or once per file in the order of the files
+batch_upload_parser = api.parser()
+batch_upload_parser = batch_upload_parser.add_argument("files", location="files", type="FileStorage", action="append", required=True)
+batch_upload_parser = batch_upload_parser.add_argument("imgScalePer", type=str, location="form", action="append", required=True)
+batch_upload_parser = batch_upload_parser.add_argument("xPosPer", type=str, location="form", action="append", required=True)
+batch_upload_parser = batch_upload_parser.add_argument("yPosPer", type=str, location="form", action="append", required=True)
+batch_upload_parser = batch_upload_parser.add_argument("bgFill", type=str, location="form", action="append", required=False, choices=[bf.value for bf in BackgroundFill])
 
 
 @ns.route("/<int:device_id>/wallpaper/file")
@@ -44,6 +59,13 @@ class FileRes(Resource):
 
 		file_name: str = get_wallpaper_name(wallpaper_id)
 		
+		# packed wallpapers are not an image format, hand out a BMP decoded from it
+		if is_packed_file(file_name):
+			stream: BytesIO = BytesIO()
+			read_packed_image(os.path.join(DIR_APP_UPLOAD, file_name)).save(stream, format="BMP")
+			stream.seek(0)
+			return send_file(stream, mimetype="image/bmp", download_name=f"{os.path.splitext(file_name)[0]}.bmp")
+		
 		return send_from_directory(DIR_APP_UPLOAD, file_name)
 
 
@@ -69,21 +91,69 @@ class DeviceWallpaperListRes(Resource):
 class DeviceWallpaperUploadRes(Resource):
 	@login_required
 	@ns.expect(upload_parser, validate=True)
-	@ns.response(204, "Success")
+	@ns.response(202, "Accepted", wallpaper_job_fields)
+	@ns.marshal_with(wallpaper_job_fields, code=202)
 	def post(self, device_id: int):
 		user_id: int = session.get("userId", 0)
 		
 		if not can_access_device(user_id, device_id):
 			api_abort(ErrorCode.FORBIDDEN)
 				
-		create_wallpaper(
+		job: dict = create_wallpaper(
 			user_id,
 			device_id,
 			request.files.get("file"),
 			request.form
 		)
 
-		return "", 204
+		return job, 202
+
+
+@ns.route("/<int:device_id>/wallpaper/batch-upload")
+@ns.param("device_id", "Device ID")
+class DeviceWallpaperBatchUploadRes(Resource):
+	@login_required
+	@ns.expect(batch_upload_parser, validate=True)
+	@ns.response(202, "Accepted", wallpaper_job_fields)
+	@ns.marshal_with(wallpaper_job_fields, code=202)
+	def post(self, device_id: int):
+		# batches get a limit of their own, set before the form is parsed, the files are
+		# spooled to disk by the parser and streamed on from there
+		request.max_content_length = current_app.config.get("WALLPAPER_BATCH_MAX_CONTENT_LENGTH", DEFAULT_BATCH_MAX_CONTENT_LENGTH)
+		
+		user_id: int = session.get("userId", 0)
+		
+		if not can_access_device(user_id, device_id):
+			api_abort(ErrorCode.FORBIDDEN)
+		
+		job: dict = create_wallpapers(
+			user_id,
+			device_id,
+			request.files.getlist("files"),
+			request.form
+		)
+
+		return job, 202
+
+
+@ns.route("/<int:device_id>/wallpaper/jobs/<string:job_id>")
+@ns.param("device_id", "Device ID")
+@ns.param("job_id", "Upload job ID")
+class DeviceWallpaperJobRes(Resource):
+	@login_required
+	@ns.response(200, "Success", wallpaper_job_fields)
+	@ns.marshal_with(wallpaper_job_fields)
+	def get(self, device_id: int, job_id: str):
+		user_id: int = session.get("userId", 0)
+		
+		if not can_access_device(user_id, device_id):
+			api_abort(ErrorCode.FORBIDDEN)
+		
+		job: dict | None = get_job(job_id)
+		if job is None or job["deviceId"] != device_id:
+			api_abort(ErrorCode.RESOURCE_NOT_FOUND, detail="Job not found")
+		
+		return job, 200
 		
 		
 @ns.route("/<int:device_id>/wallpaper/delete-all")
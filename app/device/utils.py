@@ -7,6 +7,8 @@ from re import Pattern
 from sqlalchemy import select
 
 from app import db
+from app.frame.consts import FrameCodec
+from app.wallpaper.consts import DitherMethod
 
 from .consts import DEVICE_TYPES, Orientation
 from .models import DeviceModel
@@ -65,3 +67,32 @@ def is_orientation_valid(orientation: str | None) -> str | None:
 			return "Unsupported orientation."
 			
 	return None
+
+
+def is_dither_method_valid(dither_method: str | None) -> str | None:
+	if dither_method is None:
+		return "This is a required property."
+		
+	if sys.version_info < (3, 13):
+		dither_methods: list[str] = [str(dm.value) for dm in DitherMethod]
+		if dither_method not in dither_methods:
+			return "Unsupported dither method."
+	else:
+		if dither_method not in DitherMethod:
+			return "Unsupported dither method."
+			
+	return None
+
+
+def is_supported_codecs_valid(supported_codecs: list[str] | None) -> str | None:
+	if supported_codecs is None:
+		return "This is a required property."
+	
+	if len(supported_codecs) == 0:
+		return "At least one codec is required."
+		
+	for codec in supported_codecs:
+		if codec not in FrameCodec.__members__:
+			return f"Unsupported codec '{codec}'."
+			
+	return None
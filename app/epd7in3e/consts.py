@@ -11,20 +11,20 @@ class SupportedColors(Enum):
 	GREEN		= "GREEN"
 	# ORANGE 	= "ORANGE" 	# 0100
 
-	def get_epd_color(self):
+	def get_epd_index(self) -> int | None:
 		if self.name == "BLACK":
-			return 0x000000	# 0000  BGR
+			return 0x0		# 0000
 		elif self.name == "WHITE":
-			return 0xffffff  # 0001
+			return 0x1		# 0001
 		elif self.name == "YELLOW":
-			return 0x00ffff  # 0010
+			return 0x2		# 0010
 		elif self.name == "RED":
-			return 0x0000ff  # 0011
-		#COLOR_EPD_ORANGE: int = 0x0080ff 	# 0100
+			return 0x3		# 0011
+		#ORANGE: 0x4 		# 0100
 		elif self.name == "BLUE":
-			return 0xff0000  # 0101
+			return 0x5		# 0101
 		elif self.name == "GREEN":
-			return 0x00ff00  # 0110
+			return 0x6		# 0110
 		else:
 			return None
 			
@@ -33,12 +33,28 @@ class SupportedColors(Enum):
 EPD_DIMENSIONS: tuple[int, int] = (800, 480)
 
 
+# Bits per pixel sent to the panel
+EPD_BPP: int = 4
+
+
 # Buffer length
-BUFFER_LEN: int = int(EPD_DIMENSIONS[0] * EPD_DIMENSIONS[1] * 0.5)
+BUFFER_LEN: int = EPD_DIMENSIONS[0] * EPD_DIMENSIONS[1] * EPD_BPP // 8
 
 
-# E-Paper Display color per channel
-EPD_NC: int = 2
+# E-Paper Display palette (RGB), position in the tuple is the color index sent to the panel
+# Unsupported entries are None and never picked when dithering
+EPD_PALETTE: tuple[tuple[int, int, int] | None, ...] = (
+	(0, 0, 0),			# BLACK
+	(255, 255, 255),	# WHITE
+	(255, 255, 0),		# YELLOW
+	(255, 0, 0),		# RED
+	None,				# ORANGE
+	(0, 0, 255),		# BLUE
+	(0, 255, 0),		# GREEN
+)
+
+# Id of EPD_PALETTE in packed wallpaper files
+EPD_PALETTE_ID: int = 1
 
 
 # Default Colors
@@ -54,6 +70,17 @@ SHADOW_OFFSET_X: int = -10
 SHADOW_OFFSET_Y: int = 10
 
 
+# Decoded base layers (wallpaper + grid) kept in memory, one layer is a byte per pixel
+BASE_LAYER_CACHE_MAX_BYTES: int = 8 * 1024 * 1024 # 8 MB, 21 full frames
+
+# Packed base buffers kept in memory, BUFFER_LEN each
+PACKED_BASE_CACHE_MAX_BYTES: int = 4 * 1024 * 1024 # 4 MB, 21 full frames
+
+# Packed wallpaper files kept mapped, each map holds a file descriptor while its pages
+# live in the OS page cache
+MAPPED_BASE_CACHE_MAX_FILES: int = 64
+
+
 '''
 # EPD supported colors (copied from epd lib)
 COLOR_EPD_BLACK	= 0x000000	# 0000  BGR
@@ -0,0 +1,144 @@
+import math
+import os
+
+from functools import lru_cache
+from logging import Logger, getLogger
+
+from PIL.Image import Image
+from PIL.ImageFont import FreeTypeFont
+from PIL import Image as PImg
+from PIL import ImageDraw as PImgDraw
+from PIL import ImageFont as PImgFont
+
+from app.consts import *
+
+from .consts import *
+
+
+logger: Logger = getLogger(__name__)
+
+
+# Characters used by the clock label, rasterized up front for every atlas
+GLYPH_CHARS: str = "0123456789:"
+
+# Value marking pixels a label layer does not cover, outside of any panel color index
+LABEL_TRANSPARENT: int = 0xFF
+
+# Clock labels are always "HH:MM", the font is monospaced so any text of this length
+# resolves to the same size
+LABEL_TEXT_TEMPLATE: str = "00:00"
+
+LABEL_FONT_PATH: str = os.path.join(DIR_FONT, "RobotoMono-Bold.ttf")
+
+# Font size the label sizing starts from
+MIN_FONT_SIZE: int = 5
+
+
+class GlyphAtlas:
+	'''
+	Pre-rasterized 1-bit glyph masks for one font and size.
+	Labels are built by pasting the cached masks with the label color instead of
+	running FreeType on every tick, the masks are color independent so one atlas
+	serves every label color.
+	Glyphs are placed on whole pixels, FreeType rounds a whole string at once so a glyph
+	can land up to 1px away from where draw.text would put it.
+	'''
+	def __init__(self, font: FreeTypeFont) -> None:
+		self.font: FreeTypeFont = font
+		self.glyphs: dict[str, tuple[Image, tuple[int, int], float]] = {}
+
+		for char in GLYPH_CHARS:
+			self.get_glyph(char)
+
+	def get_glyph(self, char: str) -> tuple[Image, tuple[int, int], float]:
+		glyph: tuple[Image, tuple[int, int], float] | None = self.glyphs.get(char)
+		if glyph is not None:
+			return glyph
+
+		# offset of the glyph bitmap from the pen position, same anchor as the label ("lt")
+		l, t, r, b = self.font.getbbox(char, anchor="lt")
+		mask: Image = PImg.new("1", (max(1, int(r - l)), max(1, int(b - t))))
+		PImgDraw.Draw(mask).text((-l, -t), char, 1, self.font, anchor="lt")
+
+		glyph = (mask, (int(l), int(t)), self.font.getlength(char))
+		self.glyphs[char] = glyph
+		return glyph
+
+	# Glyph masks of text with the pixel position of their top left corner
+	def place(self, xy: tuple[float, float], text: str) -> list[tuple[Image, tuple[int, int]]]:
+		placed: list[tuple[Image, tuple[int, int]]] = []
+		pen_x: float = xy[0]
+		y: int = math.floor(xy[1] + 0.5)
+
+		# round half up instead of round() (half to even), so shifting xy by whole
+		# pixels shifts every glyph by exactly the same amount
+		for char in text:
+			mask, offset, advance = self.get_glyph(char)
+			placed.append((mask, (math.floor(pen_x + 0.5) + offset[0], y + offset[1])))
+			pen_x += advance
+
+		return placed
+
+	def draw(self, image: Image, xy: tuple[float, float], text: str, ink: int) -> None:
+		for mask, pos in self.place(xy, text):
+			image.paste(ink, pos, mask)
+
+	# Box (l, t, r, b) covering every pixel draw would touch
+	def bbox(self, xy: tuple[float, float], text: str) -> tuple[int, int, int, int] | None:
+		placed: list[tuple[Image, tuple[int, int]]] = self.place(xy, text)
+		if len(placed) == 0:
+			return None
+
+		return (
+			min(pos[0] for _, pos in placed),
+			min(pos[1] for _, pos in placed),
+			max(pos[0] + mask.width for mask, pos in placed),
+			max(pos[1] + mask.height for mask, pos in placed),
+		)
+
+
+@lru_cache(maxsize=64)
+def get_font(font_path: str, font_size: int) -> FreeTypeFont:
+	return PImgFont.truetype(font_path, font_size)
+
+
+@lru_cache(maxsize=32)
+def get_glyph_atlas(font_path: str, font_size: int) -> GlyphAtlas:
+	logger.debug(f"Rasterizing glyph atlas {font_path=} {font_size=}")
+	return GlyphAtlas(get_font(font_path, font_size))
+
+
+# Smallest font size (not below MIN_FONT_SIZE) whose text length reaches target_width.
+# Text length only grows with the font size, so the size is found with a binary search,
+# doubling the upper bound until it is wide enough first.
+def _search_font_size(font_path: str, text: str, target_width: float) -> int:
+	def reaches(size: int) -> bool:
+		return get_font(font_path, size).getlength(text) >= target_width
+
+	lo: int = MIN_FONT_SIZE
+	if reaches(lo):
+		return lo
+
+	hi: int = lo * 2
+	while not reaches(hi):
+		lo = hi
+		hi *= 2
+
+	# reaches(lo) is False and reaches(hi) is True
+	while hi - lo > 1:
+		mid: int = (lo + hi) // 2
+		if reaches(mid):
+			hi = mid
+		else:
+			lo = mid
+
+	return hi
+
+
+# Solved sizes, bounded like the fonts: target widths follow the label sizes of every
+# device and wallpaper, the text is the label template
+@lru_cache(maxsize=128)
+def solve_font_size(font_path: str, text: str, target_width: float) -> int:
+	font_size: int = _search_font_size(font_path, text, target_width)
+	logger.debug(f"Solved font size {font_path=} {target_width=} {len(text)=} {font_size=}")
+	return font_size
@@ -1,16 +1,20 @@
-import os
+import numpy as np
 
+from flask import Flask
 from logging import Logger, getLogger
 from PIL.Image import Image
 from PIL.ImageDraw import ImageDraw
-from PIL.ImageFont import FreeTypeFont
-from PIL import ImageFont as PImgFont
 from PIL import Image as PImg
 from PIL import ImageDraw as PImgDraw
 
 from app.consts import *
+from app.frame.packed import PackedHeader, is_packed_file, map_packed_file, read_packed_image
+from app.frame.utils import pack_indices, patch_packed, unpack_region
+from app.lib.lru import ByteLRU
+from app.wallpaper.dither import to_pil_palette
 
 from .consts import *
+from .label import GlyphAtlas, LABEL_FONT_PATH, LABEL_TRANSPARENT, LABEL_TEXT_TEMPLATE, get_glyph_atlas, solve_font_size
 
 logger: Logger = getLogger(__name__)
 
@@ -24,29 +28,145 @@ def draw_grids(draw: ImageDraw) -> None:
 	# White every 10px
 	for x in range(80):
 		x_p: int = (x + 1) * 10
-		draw.line((x_p, 0, x_p, 480), SupportedColors.WHITE.get_epd_color(), 1)
+		draw.line((x_p, 0, x_p, 480), SupportedColors.WHITE.get_epd_index(), 1)
 	for y in range(48):
 		y_p: int = (y + 1) * 10
-		draw.line((0, y_p, 800, y_p), SupportedColors.WHITE.get_epd_color(), 1)
+		draw.line((0, y_p, 800, y_p), SupportedColors.WHITE.get_epd_index(), 1)
 
 	# Black 1/3
-	draw.line((266, 0, 266, 480), SupportedColors.BLACK.get_epd_color(), 1)
-	draw.line((532, 0, 532, 480), SupportedColors.BLACK.get_epd_color(), 1)
-	draw.line((0, 159, 800, 159), SupportedColors.BLACK.get_epd_color(), 1)
-	draw.line((0, 319, 800, 319), SupportedColors.BLACK.get_epd_color(), 1)
+	draw.line((266, 0, 266, 480), SupportedColors.BLACK.get_epd_index(), 1)
+	draw.line((532, 0, 532, 480), SupportedColors.BLACK.get_epd_index(), 1)
+	draw.line((0, 159, 800, 159), SupportedColors.BLACK.get_epd_index(), 1)
+	draw.line((0, 319, 800, 319), SupportedColors.BLACK.get_epd_index(), 1)
 
 	# Red 1/2
-	draw.line((400, 0, 400, 480), SupportedColors.RED.get_epd_color(), 1)
-	draw.line((0, 240, 800, 240), SupportedColors.RED.get_epd_color(), 1)
+	draw.line((400, 0, 400, 480), SupportedColors.RED.get_epd_index(), 1)
+	draw.line((0, 240, 800, 240), SupportedColors.RED.get_epd_index(), 1)
 
 
-# Copied from epd7in3e.py
-def convert_image_to_buffer(image:Image) -> list[int]:
-	# Create a palette with the 7 colors supported by the panel
+# Wallpapers processed before palette dithering are stored as RGB, map them onto the
+# panel palette the same way the panel library does (dithering if needed)
+def convert_image_to_indexed(image: Image) -> Image:
+	if image.mode == "P":
+		return image
+
 	pal_image: Image = PImg.new("P", (1,1))
-	pal_image.putpalette( (0,0,0,  255,255,255,  255,255,0,  255,0,0,  0,0,0,  0,0,255,  0,255,0) + (0,0,0)*249)
-	# pal_image.putpalette( (0,0,0,  255,255,255,  0,255,0,   0,0,255,  255,0,0,  255,255,0, 255,128,0) + (0,0,0)*249)
+	pal_image.putpalette(to_pil_palette(EPD_PALETTE))
+
+	return image.convert("RGB").quantize(palette=pal_image)
+
+
+# Static part of a frame: the decoded wallpaper with the debug grid drawn over it.
+# It only changes with the wallpaper file, so it is decoded once and every tick only
+# composites the label on a copy.
+# Wallpaper files are never rewritten in place (new uploads get a new name), so the
+# path identifies the content and only deleting the file invalidates it. Label edits
+# bump WallpaperModel.updated_at, which is part of the frame key, not of this one.
+base_layers: ByteLRU[Image] = ByteLRU(BASE_LAYER_CACHE_MAX_BYTES, lambda img: img.width * img.height)
+
+
+def get_base_layer(file_path: str, draw_grid: bool) -> Image:
+	key: tuple[str, bool] = (file_path, draw_grid)
+	image: Image | None = base_layers.get(key)
+	if image is not None:
+		return image
+	
+	# Create image, drawing below uses panel color indices
+	if is_packed_file(file_path):
+		image = read_packed_image(file_path)
+	else:
+		image = convert_image_to_indexed(PImg.open(file_path))
+		image.load()
+
+	# Debug - draw grids
+	if draw_grid:
+		draw_grids(PImgDraw.Draw(image))
+	
+	base_layers.put(key, image)
+	return image
+
+
+packed_bases: ByteLRU[bytes] = ByteLRU(PACKED_BASE_CACHE_MAX_BYTES)
+
+# Packed wallpaper files are used straight from a read only map instead, their pages are
+# shared through the OS page cache (between worker processes too) so only the number of
+# open maps is bounded, every entry counts as 1
+mapped_bases: ByteLRU[tuple[PackedHeader, np.ndarray]] = ByteLRU(MAPPED_BASE_CACHE_MAX_FILES, lambda _: 1)
+
+
+# Packed frame of the wallpaper (+ grid) with the size of the wallpaper, which is the
+# canvas the label is laid out on
+def get_packed_base(file_path: str, draw_grid: bool) -> tuple[tuple[int, int], bytes | np.ndarray]:
+	if not draw_grid and (mapped := _map_packed_base(file_path)) is not None:
+		return mapped
+	
+	base_image: Image = get_base_layer(file_path, draw_grid)
+	
+	key: tuple[str, bool] = (file_path, draw_grid)
+	buffer: bytes | None = packed_bases.get(key)
+	if buffer is None:
+		buffer = convert_image_to_buffer(base_image)
+		packed_bases.put(key, buffer)
+	
+	return base_image.size, buffer
+
+
+# Packed wallpaper files already hold the panel frame, returns None if the file is not
+# one or was packed for a different panel layout
+def _map_packed_base(file_path: str) -> tuple[tuple[int, int], np.ndarray] | None:
+	if not is_packed_file(file_path):
+		return None
+	
+	mapped: tuple[PackedHeader, np.ndarray] | None = mapped_bases.get(file_path)
+	if mapped is None:
+		mapped = map_packed_file(file_path)
+		mapped_bases.put(file_path, mapped)
+	
+	header, data = mapped
+	if (header.width, header.height) != EPD_DIMENSIONS or header.bpp != EPD_BPP or header.palette_id != EPD_PALETTE_ID:
+		logger.warning(f"Packed file does not match the panel, repacking {file_path=} {header=}")
+		return None
+	
+	return header.image_size, data
+
+
+def init_app(app: Flask) -> None:
+	base_layers.resize(app.config.get("WALLPAPER_CACHE_MAX_BYTES", BASE_LAYER_CACHE_MAX_BYTES))
+	
+	logger.info(f"Wallpaper cache {base_layers.max_bytes=} {packed_bases.max_bytes=} {mapped_bases.max_bytes=}")
+
+
+# Load the wallpaper ahead of its first tick, e.g. for the next entry of a queue
+def prefetch_wallpaper(file_path: str, draw_grid: bool) -> None:
+	try:
+		get_packed_base(file_path, draw_grid)
+	except (IOError, ValueError) as error:
+		logger.error(f"Unable to prefetch wallpaper {file_path=}: {error}")
+
+
+# Drop everything cached for a wallpaper file, called when the file is deleted
+def forget_wallpaper_file(file_path: str) -> None:
+	base_layers.discard_if(lambda key: key[0] == file_path)
+	packed_bases.discard_if(lambda key: key[0] == file_path)
+	mapped_bases.discard(file_path)
+
 
+def clear_wallpaper_caches() -> None:
+	base_layers.clear()
+	packed_bases.clear()
+	mapped_bases.clear()
+
+
+def get_wallpaper_cache_stats() -> dict:
+	return {
+		"decoded": base_layers.stats(),
+		"packed": packed_bases.stats(),
+		"mapped": mapped_bases.stats(),
+	}
+
+
+# Copied from epd7in3e.py
+def convert_image_to_buffer(image:Image) -> bytes:
 	# Check if we need to rotate the image
 	if image.width == EPD_DIMENSIONS[0] and image.height == EPD_DIMENSIONS[1]:
 		rot_img: Image = image
@@ -55,81 +175,164 @@ def convert_image_to_buffer(image:Image) -> list[int]:
 	else:
 		logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (image.width, image.height, EPD_DIMENSIONS[0], EPD_DIMENSIONS[1]))
 	
-	# Convert the soruce image to the 7 colors, dithering if needed
-	image_7color: Image = rot_img.convert("RGB").quantize(palette=pal_image)
-	buf_7color: bytearray = bytearray(image_7color.tobytes('raw'))
+	# Pixel values are already panel color indices, no quantize needed
+	image_7color: Image = convert_image_to_indexed(rot_img)
 
 	# PIL does not support 4 bit color, so pack the 4 bits of color
 	# into a single byte to transfer to the panel
-	buffer: list[int] = [0x00] * BUFFER_LEN
-	index = 0
-	
-	for i in range(0, len(buf_7color), 2):
-		buffer[index] = (buf_7color[i] << 4) + buf_7color[i+1]
-		index += 1
+	return pack_indices(np.asarray(image_7color, dtype=np.uint8), EPD_BPP)
 
-	return buffer
 
-
-def process_image(
-	file_path: str,
-	time: str,
+# Resolve where and how big the time label is drawn, depends only on the label
+# percentages and the canvas size so it is stored with the wallpaper.
+# Returns the font size, the pixel anchor of the label and the offset of its shadow.
+def compute_label_layout(
 	label_x_per: float,
 	label_y_per: float,
 	label_w_per: float,
-	label_h_per: float,
 	img_width: int,
-	img_height: int,
-	color: str,
-	shadow: str,
-	draw_grid: bool
-):
-	logger.info(f"process_image {file_path=} {time=} {label_x_per=} {label_y_per=} {label_w_per=} {label_h_per=} {img_width=} {img_height=} {color=} {shadow=} {draw_grid=}")
+	img_height: int
+) -> tuple[int, tuple[int, int], tuple[float, float]]:
+	text_x_pos: int = int(label_x_per * img_width)
+	text_y_pos: int = int(label_y_per * img_height)
+	target_text_width: float = label_w_per * img_width
+	
+	# get the correct font size, solved once per label width and text length
+	font_size: int = solve_font_size(LABEL_FONT_PATH, LABEL_TEXT_TEMPLATE, target_text_width)
 	
+	anchor: tuple[int, int] = (text_x_pos + TEXT_OFFSET_X, text_y_pos + TEXT_OFFSET_Y)
+	shadow_offset: tuple[float, float] = (SHADOW_OFFSET_X * label_w_per, SHADOW_OFFSET_Y * label_w_per)
+	
+	return font_size, anchor, shadow_offset
+
+
+def _to_epd_index(color: str) -> int | None:
 	try:
-		epd_color = SupportedColors[color].get_epd_color()
+		return SupportedColors[color].get_epd_index()
 	except Exception as e:
-		epd_color = SupportedColors.NONE.get_epd_color()
 		logger.error(f"Caught invalid argument: {color=}")
+		return SupportedColors.NONE.get_epd_index()
+
+
+# Render the label on its own layer, covering the label's bounding box clipped to
+# image_size and extended so its columns after rotating to the panel fall on byte
+# boundaries of the packed buffer. Pixels the label does not cover hold LABEL_TRANSPARENT.
+# Returns the (l, t) position of the layer in the image, or None without a label.
+def render_label_layer(
+	image_size: tuple[int, int],
+	time: str,
+	font_size: int,
+	anchor: tuple[int, int],
+	shadow_offset: tuple[float, float],
+	epd_color: int | None,
+	epd_shadow: int | None
+) -> tuple[tuple[int, int], np.ndarray] | None:
+	atlas: GlyphAtlas = get_glyph_atlas(LABEL_FONT_PATH, font_size)
+	shadow_xy: tuple[float, float] = (anchor[0] + shadow_offset[0], anchor[1] + shadow_offset[1])
 	
-	try:
-		epd_shadow = SupportedColors[shadow].get_epd_color()
-	except Exception as e:
-		epd_shadow = SupportedColors.NONE.get_epd_color()
-		logger.error(f"Caught invalid argument: {shadow=}")
+	boxes: list[tuple[int, int, int, int]] = []
+	if epd_shadow is not None and (box := atlas.bbox(shadow_xy, time)) is not None:
+		boxes.append(box)
+	if epd_color is not None and (box := atlas.bbox(anchor, time)) is not None:
+		boxes.append(box)
+	if len(boxes) == 0:
+		return None
+	
+	l: int = min(box[0] for box in boxes)
+	t: int = min(box[1] for box in boxes)
+	r: int = max(box[2] for box in boxes)
+	b: int = max(box[3] for box in boxes)
+	
+	# Vertical images are rotated before packing, their rows become the panel columns
+	per_byte: int = 8 // EPD_BPP
+	if image_size[0] == EPD_DIMENSIONS[0]:
+		l, r = l - l % per_byte, r + (-r) % per_byte
+	else:
+		t, b = t - t % per_byte, b + (-b) % per_byte
+	
+	l, t = max(0, l), max(0, t)
+	r, b = min(image_size[0], r), min(image_size[1], b)
+	if l >= r or t >= b:
+		return None
 	
-	# Create image
-	image: Image = PImg.open(file_path)
+	layer: Image = PImg.new("L", (r - l, b - t), LABEL_TRANSPARENT)
+	if epd_shadow is not None:
+		atlas.draw(layer, (shadow_xy[0] - l, shadow_xy[1] - t), time, epd_shadow)
+	if epd_color is not None:
+		atlas.draw(layer, (anchor[0] - l, anchor[1] - t), time, epd_color)
 	
-	# Create draw canvas from image
-	draw: ImageDraw = PImgDraw.Draw(image)
+	return (l, t), np.asarray(layer)
 
-	# Debug - draw grids
-	if draw_grid:
-		draw_grids(draw)
 
-	text_x_pos: int = int(label_x_per * img_width)
-	text_y_pos: int = int(label_y_per * img_height)
-	target_text_width: float = label_w_per * img_width
-	font_path: str = os.path.join(DIR_FONT, "RobotoMono-Bold.ttf")
-	font_size: int = 5
-	font: FreeTypeFont = PImgFont.truetype(font_path, font_size)
+def process_image(
+	file_path: str,
+	time: str,
+	font_size: int,
+	anchor: tuple[int, int],
+	shadow_offset: tuple[float, float],
+	color: str,
+	shadow: str,
+	draw_grid: bool
+):
+	logger.info(f"process_image {file_path=} {time=} {font_size=} {anchor=} {shadow_offset=} {color=} {shadow=} {draw_grid=}")
 	
-	# get the correct font size
-	current_text_width: float = draw.textlength(time, font=font)
-	while current_text_width < target_text_width:
-		font_size += 1
-		font = PImgFont.truetype(font_path, font_size)
-		current_text_width = draw.textlength(time, font=font)
+	epd_color: int | None = _to_epd_index(color)
+	epd_shadow: int | None = _to_epd_index(shadow)
 	
+	# Only the label is drawn per frame, the glyph pastes touch nothing outside
+	# the label's bounding box
+	image: Image = get_base_layer(file_path, draw_grid).copy()
+
+	# label is pasted from cached glyph masks, no text rasterizing per tick
+	atlas: GlyphAtlas = get_glyph_atlas(LABEL_FONT_PATH, font_size)
+
 	# draw shadow text first
 	if epd_shadow is not None:
-		draw.text((text_x_pos + TEXT_OFFSET_X + SHADOW_OFFSET_X * label_w_per, text_y_pos + TEXT_OFFSET_Y + SHADOW_OFFSET_Y * label_w_per), time, epd_shadow, font, anchor="lt")
+		atlas.draw(image, (anchor[0] + shadow_offset[0], anchor[1] + shadow_offset[1]), time, epd_shadow)
 
 	# draw text next
 	if epd_color is not None:
-		draw.text((text_x_pos + TEXT_OFFSET_X, text_y_pos + TEXT_OFFSET_Y), time, epd_color, font, anchor="lt")
+		atlas.draw(image, anchor, time, epd_color)
 	
 	return image
 
-
+# Same frame as convert_image_to_buffer(process_image(...)), built by patching only the
+# bytes under the label in the cached packed base buffer, so the work per tick scales
+# with the label area instead of the panel area.
+def process_buffer(
+	file_path: str,
+	time: str,
+	font_size: int,
+	anchor: tuple[int, int],
+	shadow_offset: tuple[float, float],
+	color: str,
+	shadow: str,
+	draw_grid: bool
+) -> bytes:
+	logger.info(f"process_buffer {file_path=} {time=} {font_size=} {anchor=} {shadow_offset=} {color=} {shadow=} {draw_grid=}")
+	
+	image_size, base = get_packed_base(file_path, draw_grid)
+	buffer: bytearray = bytearray(base)
+	
+	label = render_label_layer(image_size, time, font_size, anchor, shadow_offset, _to_epd_index(color), _to_epd_index(shadow))
+	if label is None:
+		return bytes(buffer)
+	
+	(l, t), layer = label
+	h: int = layer.shape[0]
+	w: int = layer.shape[1]
+	
+	# map the layer into the panel orientation, same rotation as convert_image_to_buffer
+	if image_size[0] == EPD_DIMENSIONS[0]:
+		x, y = l, t
+	else:
+		layer = np.rot90(layer)
+		x, y = t, image_size[0] - (l + w)
+	
+	# label over the wallpaper pixels it covers, read back from the packed base so the
+	# wallpaper is never decoded on a tick
+	covered = unpack_region(base, EPD_DIMENSIONS[0], EPD_BPP, x, y, layer.shape[1], layer.shape[0])
+	region = np.where(layer != LABEL_TRANSPARENT, layer, covered)
+	
+	patch_packed(buffer, EPD_DIMENSIONS[0], EPD_BPP, region, x, y)
+	return bytes(buffer)
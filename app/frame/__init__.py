@@ -0,0 +1,20 @@
+from flask import Flask
+from flask_restx import Api, Namespace
+
+ns: Namespace = Namespace("frame_v1", description="Rendered frame operations (Ver 1)", path="/1/frame")
+
+def append_namespace(api: Api) -> None:
+	# This is to trigger the import of routes
+	from . import routes
+ 
+	api.add_namespace(ns)
+
+
+def init_app(app: Flask) -> None:
+	from app.epd7in3e import logic as epd7in3e_logic
+	from . import cache, delta, envelope
+	
+	cache.init_app(app)
+	delta.init_app(app)
+	envelope.init_app(app)
+	epd7in3e_logic.init_app(app)
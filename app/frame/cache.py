@@ -0,0 +1,163 @@
+import threading
+
+from datetime import datetime
+from logging import Logger, getLogger
+
+from flask import Flask
+
+from app import redis_controller
+from app.lib.lru import ByteLRU
+
+from .consts import *
+
+
+logger: Logger = getLogger(__name__)
+
+
+'''
+Rendered frames (the packed buffer encoded with the device's codec) are cached in two tiers,
+a bounded in-memory LRU and an optional Redis tier shared between processes.
+A key holds everything the frame is rendered from, so entries never need to be
+updated, stale ones simply stop being asked for and age out.
+Keys are also tracked per device, so frames prerendered for a device can be dropped
+as soon as they can no longer be shown (queue or settings changed) instead of
+holding on to the byte budget.
+'''
+frame_lru: ByteLRU[bytes] = ByteLRU(DEFAULT_FRAME_CACHE_MAX_BYTES)
+is_redis_enabled: bool = False
+redis_ttl: int = DEFAULT_FRAME_CACHE_REDIS_TTL
+redis_hits: int = 0
+redis_misses: int = 0
+prerender_minutes: int = DEFAULT_FRAME_PRERENDER_MINUTES
+device_frames: dict[int, set[str]] = {}
+device_frames_lock: threading.Lock = threading.Lock()
+
+
+def init_app(app: Flask) -> None:
+	global is_redis_enabled, redis_ttl, prerender_minutes
+	
+	frame_lru.resize(app.config.get("FRAME_CACHE_MAX_BYTES", DEFAULT_FRAME_CACHE_MAX_BYTES))
+	is_redis_enabled = app.config.get("FRAME_CACHE_REDIS_ENABLED", False)
+	redis_ttl = app.config.get("FRAME_CACHE_REDIS_TTL", DEFAULT_FRAME_CACHE_REDIS_TTL)
+	prerender_minutes = app.config.get("FRAME_PRERENDER_MINUTES", DEFAULT_FRAME_PRERENDER_MINUTES)
+	
+	logger.info(f"Frame cache {frame_lru.max_bytes=} {is_redis_enabled=} {redis_ttl=} {prerender_minutes=}")
+
+
+def get_redis_ttl() -> int:
+	return redis_ttl
+
+
+def get_prerender_minutes() -> int:
+	return prerender_minutes
+
+
+def make_frame_key(
+	wallpaper_id: int,
+	wallpaper_updated_at: datetime | None,
+	time: str,
+	color: str,
+	shadow: str,
+	is_draw_grid: bool,
+	device_type: str,
+	width: int,
+	height: int,
+	orientation: str,
+	codec: FrameCodec
+) -> str:
+	updated_at: str = "0" if wallpaper_updated_at is None else wallpaper_updated_at.isoformat()
+	
+	return f"{FRAME_KEY_PREFIX}:{wallpaper_id}:{updated_at}:{time}:{color}:{shadow}:{int(is_draw_grid)}:{device_type}:{width}x{height}:{orientation}:{codec.name}"
+
+
+def get_frame(key: str) -> bytes | None:
+	global redis_hits, redis_misses
+	
+	data: bytes | None = frame_lru.get(key)
+	if data is not None or not is_redis_enabled:
+		return data
+	
+	try:
+		data = redis_controller.rget_bytes(key)
+	except Exception as ex:
+		logger.error(f"Unable to read frame from redis: {ex}")
+		return None
+	
+	if data is None:
+		redis_misses += 1
+		return None
+	
+	redis_hits += 1
+	frame_lru.put(key, data)
+	return data
+
+
+def put_frame(key: str, data: bytes, ttl: int | None = None) -> None:
+	frame_lru.put(key, data)
+	
+	if not is_redis_enabled:
+		return
+	
+	try:
+		redis_controller.rsetex_bytes(key, data, ttl or redis_ttl)
+	except Exception as ex:
+		logger.error(f"Unable to write frame to redis: {ex}")
+
+
+def track_device_frame(device_id: int, key: str) -> None:
+	with device_frames_lock:
+		keys: set[str] = device_frames.get(device_id, set())
+		
+		# forget frames the memory tier already let go of, the redis tier expires its own
+		keys = {k for k in keys if k in frame_lru}
+		
+		keys.add(key)
+		device_frames[device_id] = keys
+
+
+def invalidate_device_frames(device_id: int) -> None:
+	with device_frames_lock:
+		keys: set[str] = device_frames.pop(device_id, set())
+	
+	for key in keys:
+		frame_lru.discard(key)
+	
+	logger.debug(f"Invalidated frames {device_id=} {len(keys)=}")
+	
+	if not is_redis_enabled:
+		return
+	
+	try:
+		for key in keys:
+			redis_controller.rdelete(key)
+	except Exception as ex:
+		logger.error(f"Unable to invalidate frames in redis: {ex}")
+
+
+def clear_frames() -> None:
+	frame_lru.clear()
+	
+	with device_frames_lock:
+		device_frames.clear()
+	
+	if not is_redis_enabled:
+		return
+	
+	try:
+		redis_controller.rdelete_match(f"{FRAME_KEY_PREFIX}:*")
+	except Exception as ex:
+		logger.error(f"Unable to clear frames from redis: {ex}")
+
+
+def get_frame_cache_stats() -> dict:
+	return {
+		"memory": frame_lru.stats(),
+		"redis": {
+			"enabled": is_redis_enabled,
+			"ttl": redis_ttl,
+			"hits": redis_hits,
+			"misses": redis_misses,
+		},
+		"prerenderMinutes": prerender_minutes,
+		"trackedDevices": len(device_frames),
+	}
@@ -0,0 +1,65 @@
+import bz2
+import lzma
+import zlib
+
+from logging import Logger, getLogger
+from typing import Callable, Sequence
+
+import numpy as np
+
+from .consts import *
+
+
+logger: Logger = getLogger(__name__)
+
+
+# Run-length encoding of the packed bytes as (count, byte) pairs, runs longer than 255
+# are split. Flat areas of 4bpp frames are long runs of the same pixel pair, and
+# decoding is a single np.repeat on the panel side.
+def _rle_encode(data: bytes) -> bytes:
+	arr = np.frombuffer(data, dtype=np.uint8)
+	if arr.size == 0:
+		return b""
+	
+	starts = np.flatnonzero(np.concatenate(([True], arr[1:] != arr[:-1])))
+	lengths = np.diff(np.append(starts, arr.size))
+	
+	chunks = (lengths + 254) // 255
+	values = np.repeat(arr[starts], chunks)
+	counts = np.full(values.size, 255, dtype=np.uint8)
+	counts[np.cumsum(chunks) - 1] = lengths - 255 * (chunks - 1)
+	
+	return np.stack((counts, values), axis=1).tobytes()
+
+
+def _rle_decode(data: bytes) -> bytes:
+	pairs = np.frombuffer(data, dtype=np.uint8).reshape(-1, 2)
+	return np.repeat(pairs[:, 1], pairs[:, 0]).tobytes()
+
+
+CODECS: dict[FrameCodec, tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+	FrameCodec.RAW: (bytes, bytes),
+	FrameCodec.ZLIB: (zlib.compress, zlib.decompress),
+	FrameCodec.ZLIB_1: (lambda data: zlib.compress(data, 1), zlib.decompress),
+	FrameCodec.ZLIB_9: (lambda data: zlib.compress(data, 9), zlib.decompress),
+	FrameCodec.BZ2: (bz2.compress, bz2.decompress),
+	FrameCodec.LZMA: (lzma.compress, lzma.decompress),
+	FrameCodec.RLE: (_rle_encode, _rle_decode),
+}
+
+
+def encode_frame(codec: FrameCodec, data: bytes) -> bytes:
+	return CODECS[codec][0](data)
+
+
+def decode_frame(codec: FrameCodec, data: bytes) -> bytes:
+	return CODECS[codec][1](data)
+
+
+# First codec the device supports, in the device's order of preference
+def negotiate_codec(supported_codecs: Sequence[str]) -> FrameCodec:
+	for name in supported_codecs:
+		if name in FrameCodec.__members__:
+			return FrameCodec[name]
+	
+	return DEFAULT_FRAME_CODEC
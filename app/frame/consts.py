@@ -0,0 +1,76 @@
+from enum import IntEnum
+
+
+"""
+FRAME CACHE
+"""
+# Prefix of the frame cache keys, also used for the Redis tier
+FRAME_KEY_PREFIX: str = "frame"
+
+# Defaults, overridden by FRAME_CACHE_* in the app config
+DEFAULT_FRAME_CACHE_MAX_BYTES: int = 8 * 1024 * 1024 # 8 MB
+DEFAULT_FRAME_CACHE_REDIS_TTL: int = 120 # seconds, a frame is only valid for its minute
+DEFAULT_FRAME_PRERENDER_MINUTES: int = 2
+
+
+"""
+DELTA FRAMES
+"""
+DELTA_MAGIC: bytes = b"DLTA"
+DELTA_VERSION: int = 1
+
+# magic, version, width, height, bpp, crc32 of the frame it applies to, crc32 of the result, rect count
+DELTA_HEADER_FORMAT: str = ">4sBHHBIIH"
+# x (in bytes), y, width (in bytes), height, followed by width * height bytes of packed pixels
+DELTA_RECT_FORMAT: str = ">HHHH"
+
+# Changed rows closer than this are sent as one rectangle
+DELTA_ROW_GAP: int = 4
+
+# Defaults, overridden by FRAME_DELTA_* in the app config
+DEFAULT_FRAME_DELTA_KEYFRAME_INTERVAL: int = 30 # frames
+
+
+"""
+FRAME ENVELOPE
+"""
+class FrameFormat(IntEnum):
+	FULL = 0	# whole packed frame
+	DELTA = 1	# delta payload, see delta.py
+
+
+# Wire id of the codec a frame body is compressed with, devices declare the names
+# of the codecs they decode in order of preference
+class FrameCodec(IntEnum):
+	RAW = 0
+	ZLIB = 1	# zlib default level (6)
+	ZLIB_1 = 2
+	ZLIB_9 = 3
+	BZ2 = 4
+	LZMA = 5
+	RLE = 6		# (count, byte) runs of packed pixels, see codecs.py
+
+
+DEFAULT_FRAME_CODEC: FrameCodec = FrameCodec.ZLIB
+
+
+ENVELOPE_MAGIC: bytes = b"EPDF"
+ENVELOPE_VERSION: int = 1
+
+# magic, version, format, width, height, bpp, codec, crc32 of the body, body length
+ENVELOPE_HEADER_FORMAT: str = ">4sBBHHBBII"
+
+
+"""
+PACKED WALLPAPER FILES
+"""
+PACKED_EXTENSION: str = ".epdi"
+PACKED_MAGIC: bytes = b"EPDI"
+PACKED_VERSION: int = 1
+
+# magic, version, width, height, bpp, palette id, pipeline version, rotation (degrees)
+# width/height are of the stored pixels, which are in panel order
+PACKED_HEADER_FORMAT: str = ">4sBHHBBHH"
+
+# Header is padded so the pixel data starts aligned
+PACKED_DATA_OFFSET: int = 32
@@ -0,0 +1,146 @@
+import struct
+import threading
+import zlib
+
+from logging import Logger, getLogger
+
+import numpy as np
+
+from flask import Flask
+
+from .consts import *
+
+
+logger: Logger = getLogger(__name__)
+
+
+'''
+Delta frames: instead of the whole packed frame, only the rectangles that changed
+since the previous frame published to the device are sent, with a full keyframe
+every keyframe_interval frames (or whenever the previous frame is unknown).
+On the binary transport the compressed payload is the body of a DELTA envelope.
+
+Payload (big endian, DELTA_HEADER_FORMAT then DELTA_RECT_FORMAT per rectangle):
+	magic "DLTA", version, frame width and height in pixels, bits per pixel,
+	crc32 of the packed frame the delta applies to, crc32 of the resulting frame,
+	rectangle count, then for every rectangle its byte column, row, width in bytes
+	and height followed by its rows of packed bytes.
+apply_delta is the reference decoder for the panel side.
+'''
+keyframe_interval: int = DEFAULT_FRAME_DELTA_KEYFRAME_INTERVAL
+
+# device id -> (last packed frame published, frames published since the last keyframe)
+last_frames: dict[int, tuple[bytes, int]] = {}
+last_frames_lock: threading.Lock = threading.Lock()
+
+
+def init_app(app: Flask) -> None:
+	global keyframe_interval
+	
+	keyframe_interval = app.config.get("FRAME_DELTA_KEYFRAME_INTERVAL", DEFAULT_FRAME_DELTA_KEYFRAME_INTERVAL)
+	
+	logger.info(f"Delta frames {keyframe_interval=}")
+
+
+# Rectangles (x in bytes, y, width in bytes, height) covering every byte that differs
+# between the two packed frames
+def find_dirty_rects(prev: bytes, cur: bytes, row_bytes: int) -> list[tuple[int, int, int, int]]:
+	diff = np.frombuffer(prev, dtype=np.uint8).reshape(-1, row_bytes) != np.frombuffer(cur, dtype=np.uint8).reshape(-1, row_bytes)
+	
+	rows = np.flatnonzero(diff.any(axis=1))
+	if rows.size == 0:
+		return []
+	
+	# split the changed rows into bands wherever they are far apart
+	splits = np.flatnonzero(np.diff(rows) > DELTA_ROW_GAP) + 1
+	
+	rects: list[tuple[int, int, int, int]] = []
+	for band in np.split(rows, splits):
+		y0: int = int(band[0])
+		y1: int = int(band[-1]) + 1
+		cols = np.flatnonzero(diff[y0:y1].any(axis=0))
+		x0: int = int(cols[0])
+		x1: int = int(cols[-1]) + 1
+		rects.append((x0, y0, x1 - x0, y1 - y0))
+	
+	return rects
+
+
+def encode_delta(prev: bytes, cur: bytes, width: int, height: int, bpp: int) -> bytes:
+	row_bytes: int = width * bpp // 8
+	rects: list[tuple[int, int, int, int]] = find_dirty_rects(prev, cur, row_bytes)
+	rows = np.frombuffer(cur, dtype=np.uint8).reshape(-1, row_bytes)
+	
+	parts: list[bytes] = [struct.pack(DELTA_HEADER_FORMAT, DELTA_MAGIC, DELTA_VERSION, width, height, bpp, zlib.crc32(prev), zlib.crc32(cur), len(rects))]
+	for x, y, w, h in rects:
+		parts.append(struct.pack(DELTA_RECT_FORMAT, x, y, w, h))
+		parts.append(rows[y:y + h, x:x + w].tobytes())
+	
+	return b"".join(parts)
+
+
+# Reference decoder, applies payload onto buffer (the packed frame currently shown) in place.
+# Raises ValueError when the payload does not fit the buffer, a panel should then keep
+# its frame and wait for the next keyframe.
+def apply_delta(buffer: bytearray, payload: bytes) -> None:
+	header_size: int = struct.calcsize(DELTA_HEADER_FORMAT)
+	rect_size: int = struct.calcsize(DELTA_RECT_FORMAT)
+	if len(payload) < header_size:
+		raise ValueError("Delta payload too short")
+	
+	magic, version, width, height, bpp, base_crc, result_crc, count = struct.unpack_from(DELTA_HEADER_FORMAT, payload)
+	if magic != DELTA_MAGIC or version != DELTA_VERSION:
+		raise ValueError(f"Unsupported delta payload {magic=} {version=}")
+	
+	row_bytes: int = width * bpp // 8
+	if len(buffer) != row_bytes * height:
+		raise ValueError(f"Delta frame size mismatch {width=} {height=} {bpp=} {len(buffer)=}")
+	
+	if zlib.crc32(buffer) != base_crc:
+		raise ValueError("Delta does not apply to the current frame")
+	
+	rows = np.frombuffer(buffer, dtype=np.uint8).reshape(height, row_bytes)
+	offset: int = header_size
+	for _ in range(count):
+		x, y, w, h = struct.unpack_from(DELTA_RECT_FORMAT, payload, offset)
+		offset += rect_size
+		if x + w > row_bytes or y + h > height or offset + w * h > len(payload):
+			raise ValueError(f"Delta rect out of bounds {x=} {y=} {w=} {h=}")
+		
+		rows[y:y + h, x:x + w] = np.frombuffer(payload, dtype=np.uint8, count=w * h, offset=offset).reshape(h, w)
+		offset += w * h
+	
+	if zlib.crc32(buffer) != result_crc:
+		raise ValueError("Delta result does not match")
+
+
+# Decide how buffer reaches the device: None for a keyframe (publish the whole frame),
+# an empty payload when nothing changed, otherwise the delta payload.
+# buffer is remembered as the frame the device shows from here on.
+def next_delta(device_id: int, buffer: bytes, width: int, height: int, bpp: int) -> bytes | None:
+	with last_frames_lock:
+		prev, count = last_frames.get(device_id, (b"", keyframe_interval))
+		
+		if len(prev) != len(buffer) or count + 1 >= keyframe_interval:
+			last_frames[device_id] = (buffer, 0)
+			return None
+		
+		if prev == buffer:
+			return b""
+		
+		payload: bytes = encode_delta(prev, buffer, width, height, bpp)
+		
+		# a delta touching most of the frame is no cheaper than a keyframe
+		if len(payload) >= len(buffer) // 2:
+			last_frames[device_id] = (buffer, 0)
+			return None
+		
+		last_frames[device_id] = (buffer, count + 1)
+		return payload
+
+
+# The device no longer shows the last frame (cleared, or deltas turned off),
+# the next frame is sent whole
+def forget_device(device_id: int) -> None:
+	with last_frames_lock:
+		last_frames.pop(device_id, None)
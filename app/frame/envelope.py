@@ -0,0 +1,56 @@
+import struct
+import zlib
+
+from logging import Logger, getLogger
+
+from flask import Flask
+
+from .consts import *
+
+
+logger: Logger = getLogger(__name__)
+
+
+'''
+Binary frame envelope, published as raw bytes instead of base64 text.
+A fixed header (ENVELOPE_HEADER_FORMAT, big endian) describes the body: whether it is a
+full frame or a delta, the frame dimensions and bits per pixel, the codec the body
+is compressed with, and the crc32 and length of the body so the panel can drop a
+damaged message before decoding it.
+'''
+is_binary_transport: bool = False
+
+
+def init_app(app: Flask) -> None:
+	global is_binary_transport
+	
+	is_binary_transport = app.config.get("FRAME_BINARY_TRANSPORT", False)
+	
+	logger.info(f"Frame transport {is_binary_transport=}")
+
+
+def is_binary_transport_enabled() -> bool:
+	return is_binary_transport
+
+
+def pack_envelope(format: FrameFormat, width: int, height: int, bpp: int, codec: FrameCodec, body: bytes) -> bytes:
+	header: bytes = struct.pack(ENVELOPE_HEADER_FORMAT, ENVELOPE_MAGIC, ENVELOPE_VERSION, format, width, height, bpp, codec, zlib.crc32(body), len(body))
+	return header + body
+
+
+# Reference decoder, returns the header fields and the (still encoded) body.
+# Raises ValueError for anything that is not a complete, intact envelope.
+def unpack_envelope(data: bytes) -> tuple[FrameFormat, int, int, int, FrameCodec, bytes]:
+	header_size: int = struct.calcsize(ENVELOPE_HEADER_FORMAT)
+	if len(data) < header_size:
+		raise ValueError("Envelope too short")
+	
+	magic, version, format, width, height, bpp, codec, crc, length = struct.unpack_from(ENVELOPE_HEADER_FORMAT, data)
+	if magic != ENVELOPE_MAGIC or version != ENVELOPE_VERSION:
+		raise ValueError(f"Unsupported envelope {magic=} {version=}")
+	
+	body: bytes = data[header_size:]
+	if len(body) != length or zlib.crc32(body) != crc:
+		raise ValueError("Envelope body damaged")
+	
+	return FrameFormat(format), width, height, bpp, FrameCodec(codec), body
@@ -0,0 +1,44 @@
+from flask_restx import fields
+
+from . import ns
+
+frame_lru_stats_fields = ns.model("FrameLruStats", {
+	"entries":		fields.Integer(description="Number of cached frames"),
+	"bytes":		fields.Integer(description="Size of the cached frames in bytes"),
+	"maxBytes":		fields.Integer(description="Byte budget of the cache"),
+	"hits":			fields.Integer(description="Number of lookups served from the cache"),
+	"misses":		fields.Integer(description="Number of lookups not found in the cache"),
+	"hitRate":		fields.Float(description="Share of lookups served from the cache"),
+	"evictions":	fields.Integer(description="Number of frames evicted to stay within the budget"),
+})
+
+frame_redis_stats_fields = ns.model("FrameRedisStats", {
+	"enabled":		fields.Boolean(description="Whether the redis tier is used"),
+	"ttl":			fields.Integer(description="Lifetime of a frame in redis in seconds"),
+	"hits":			fields.Integer(description="Number of lookups served from redis"),
+	"misses":		fields.Integer(description="Number of lookups not found in redis"),
+})
+
+frame_cache_stats_fields = ns.model("FrameCacheStats", {
+	"memory":		fields.Nested(frame_lru_stats_fields, description="In-memory tier"),
+	"redis":		fields.Nested(frame_redis_stats_fields, description="Redis tier"),
+	"prerenderMinutes":	fields.Integer(description="Number of coming minutes rendered ahead of time"),
+	"trackedDevices":	fields.Integer(description="Number of devices with tracked frames"),
+})
+
+
+wallpaper_lru_stats_fields = ns.model("WallpaperLruStats", {
+	"entries":		fields.Integer(description="Number of cached wallpapers"),
+	"bytes":		fields.Integer(description="Resident size of the cached wallpapers in bytes (open maps count 1 each)"),
+	"maxBytes":		fields.Integer(description="Budget of the cache (number of open maps for mapped files)"),
+	"hits":			fields.Integer(description="Number of lookups served from the cache"),
+	"misses":		fields.Integer(description="Number of lookups not found in the cache"),
+	"hitRate":		fields.Float(description="Share of lookups served from the cache"),
+	"evictions":	fields.Integer(description="Number of wallpapers evicted to stay within the budget"),
+})
+
+wallpaper_cache_stats_fields = ns.model("WallpaperCacheStats", {
+	"decoded":		fields.Nested(wallpaper_lru_stats_fields, description="Decoded wallpaper images (base layers)"),
+	"packed":		fields.Nested(wallpaper_lru_stats_fields, description="Packed frames of decoded wallpapers"),
+	"mapped":		fields.Nested(wallpaper_lru_stats_fields, description="Memory mapped packed wallpaper files"),
+})
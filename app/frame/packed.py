@@ -0,0 +1,138 @@
+import mmap
+import struct
+
+from logging import Logger, getLogger
+from typing import BinaryIO, NamedTuple, Sequence
+
+import numpy as np
+
+from PIL.Image import Image
+from PIL import Image as PImg
+
+from app.epd7in3e.consts import EPD_PALETTE, EPD_PALETTE_ID
+from app.wallpaper.dither import to_pil_palette
+
+from .consts import *
+from .utils import pack_indices, unpack_indices
+
+
+logger: Logger = getLogger(__name__)
+
+
+'''
+Native file format of processed wallpapers: palette indices already packed for the
+panel, in panel order, behind a fixed PACKED_DATA_OFFSET byte header. The pixel data
+is the frame sent to the panel as is, so it can be read (or memory mapped) without
+any decoding.
+'''
+PALETTES: dict[int, Sequence[tuple[int, int, int] | None]] = {
+	EPD_PALETTE_ID: EPD_PALETTE,
+}
+
+
+class PackedHeader(NamedTuple):
+	width: int				# stored (panel order) width in pixels
+	height: int				# stored (panel order) height in pixels
+	bpp: int
+	palette_id: int
+	pipeline_version: int
+	rotation: int			# degrees the wallpaper was rotated by to get to panel order
+
+	@property
+	def data_len(self) -> int:
+		return self.width * self.height * self.bpp // 8
+
+	# (width, height) of the wallpaper before it was rotated into panel order
+	@property
+	def image_size(self) -> tuple[int, int]:
+		if self.rotation in (90, 270):
+			return self.height, self.width
+		
+		return self.width, self.height
+
+
+def is_packed_file(file_path: str) -> bool:
+	return file_path.lower().endswith(PACKED_EXTENSION)
+
+
+def pack_header(header: PackedHeader) -> bytes:
+	data: bytes = struct.pack(PACKED_HEADER_FORMAT, PACKED_MAGIC, PACKED_VERSION, header.width, header.height, header.bpp, header.palette_id, header.pipeline_version, header.rotation)
+	return data.ljust(PACKED_DATA_OFFSET, b"\0")
+
+
+def unpack_header(data: bytes) -> PackedHeader:
+	if len(data) < struct.calcsize(PACKED_HEADER_FORMAT):
+		raise ValueError("Packed file too short")
+	
+	magic, version, width, height, bpp, palette_id, pipeline_version, rotation = struct.unpack_from(PACKED_HEADER_FORMAT, data)
+	if magic != PACKED_MAGIC or version != PACKED_VERSION:
+		raise ValueError(f"Unsupported packed file {magic=} {version=}")
+	
+	return PackedHeader(width, height, bpp, palette_id, pipeline_version, rotation)
+
+
+# Write image (a "P" image of palette indices) rotated into panel_size order to f
+def write_packed(f: BinaryIO, image: Image, bpp: int, palette_id: int, pipeline_version: int, panel_size: tuple[int, int]) -> None:
+	if image.size == panel_size:
+		rotation: int = 0
+	elif image.size == panel_size[::-1]:
+		rotation = 90
+		image = image.rotate(rotation, expand=True)
+	else:
+		raise ValueError(f"Image size {image.size} does not fit panel {panel_size}")
+	
+	header: PackedHeader = PackedHeader(image.width, image.height, bpp, palette_id, pipeline_version, rotation)
+	f.write(pack_header(header))
+	f.write(pack_indices(np.asarray(image, dtype=np.uint8), bpp))
+
+
+def write_packed_file(file_path: str, image: Image, bpp: int, palette_id: int, pipeline_version: int, panel_size: tuple[int, int]) -> None:
+	with open(file_path, "wb") as f:
+		write_packed(f, image, bpp, palette_id, pipeline_version, panel_size)
+
+
+def read_packed_file(file_path: str) -> tuple[PackedHeader, bytes]:
+	with open(file_path, "rb") as f:
+		header: PackedHeader = unpack_header(f.read(PACKED_DATA_OFFSET))
+		data: bytes = f.read(header.data_len)
+	
+	if len(data) != header.data_len:
+		raise ValueError(f"Packed file truncated {file_path=}")
+	
+	return header, data
+
+
+# Map the file read only, the returned array is a view of the pixel data backed by the
+# OS page cache, so nothing is decoded or copied and every process mapping the same
+# file shares the same physical pages.
+# The map stays valid after the file is deleted, until the array is released.
+def map_packed_file(file_path: str) -> tuple[PackedHeader, np.ndarray]:
+	with open(file_path, "rb") as f:
+		mapped: mmap.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	
+	header: PackedHeader = unpack_header(mapped[:PACKED_DATA_OFFSET])
+	if len(mapped) < PACKED_DATA_OFFSET + header.data_len:
+		mapped.close()
+		raise ValueError(f"Packed file truncated {file_path=}")
+	
+	return header, np.frombuffer(mapped, dtype=np.uint8, count=header.data_len, offset=PACKED_DATA_OFFSET)
+
+
+# Palette indices of the wallpaper, back in the orientation it was made for
+def unpack_indices_2d(header: PackedHeader, data: bytes) -> np.ndarray:
+	indices = unpack_indices(data, header.bpp, header.width * header.height).reshape(header.height, header.width)
+	if header.rotation == 90:
+		indices = np.rot90(indices, -1)
+	
+	return np.ascontiguousarray(indices)
+
+
+def read_packed_image(file_path: str) -> Image:
+	header, data = read_packed_file(file_path)
+	
+	image: Image = PImg.fromarray(unpack_indices_2d(header, data))
+	palette: Sequence[tuple[int, int, int] | None] | None = PALETTES.get(header.palette_id)
+	if palette is not None:
+		image.putpalette(to_pil_palette(palette))
+	
+	return image
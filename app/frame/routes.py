@@ -0,0 +1,45 @@
+from logging import Logger, getLogger
+
+from flask_restx import Resource
+
+from app.epd7in3e.logic import clear_wallpaper_caches, get_wallpaper_cache_stats
+from app.lib.decorators import admin_required
+
+from . import ns
+from .cache import clear_frames, get_frame_cache_stats
+from .fields import *
+
+
+logger: Logger = getLogger(__name__)
+
+
+@ns.route("/cache")
+class FrameCacheRes(Resource):
+	@admin_required
+	@ns.response(200, "Success", model=frame_cache_stats_fields)
+	@ns.marshal_with(frame_cache_stats_fields)
+	def get(self):
+		return get_frame_cache_stats(), 200
+	
+	@admin_required
+	@ns.response(204, "Success")
+	def delete(self):
+		clear_frames()
+		
+		return "", 204
+
+
+@ns.route("/wallpaper-cache")
+class WallpaperCacheRes(Resource):
+	@admin_required
+	@ns.response(200, "Success", model=wallpaper_cache_stats_fields)
+	@ns.marshal_with(wallpaper_cache_stats_fields)
+	def get(self):
+		return get_wallpaper_cache_stats(), 200
+	
+	@admin_required
+	@ns.response(204, "Success")
+	def delete(self):
+		clear_wallpaper_caches()
+		
+		return "", 204
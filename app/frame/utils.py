@@ -0,0 +1,74 @@
+from logging import Logger, getLogger
+
+import numpy as np
+
+
+logger: Logger = getLogger(__name__)
+
+
+SUPPORTED_BPP: tuple[int, ...] = (1, 2, 4, 8)
+
+
+# Pack palette indices (one per pixel, row major) into bytes of bpp bits per pixel.
+# The first pixel goes into the most significant bits, which is what the panels expect.
+def pack_indices(indices: np.ndarray, bpp: int) -> bytes:
+	if bpp not in SUPPORTED_BPP:
+		raise ValueError(f"Unsupported bits per pixel: {bpp}")
+
+	per_byte: int = 8 // bpp
+	arr = np.asarray(indices, dtype=np.uint8).reshape(-1) & ((1 << bpp) - 1)
+
+	# pad the tail so the last byte is complete
+	if arr.size % per_byte != 0:
+		arr = np.concatenate((arr, np.zeros(per_byte - arr.size % per_byte, dtype=np.uint8)))
+
+	# one strided pass per pixel slot in the byte (at most 8)
+	arr = arr.reshape(-1, per_byte)
+	packed = np.zeros(arr.shape[0], dtype=np.uint8)
+	for slot in range(per_byte):
+		packed |= arr[:, slot] << np.uint8(bpp * (per_byte - 1 - slot))
+
+	return packed.tobytes()
+
+
+# Inverse of pack_indices, returns count palette indices
+def unpack_indices(packed: bytes, bpp: int, count: int) -> np.ndarray:
+	if bpp not in SUPPORTED_BPP:
+		raise ValueError(f"Unsupported bits per pixel: {bpp}")
+
+	per_byte: int = 8 // bpp
+	arr = np.frombuffer(packed, dtype=np.uint8)
+	out = np.empty((arr.size, per_byte), dtype=np.uint8)
+	for slot in range(per_byte):
+		out[:, slot] = (arr >> np.uint8(bpp * (per_byte - 1 - slot))) & np.uint8((1 << bpp) - 1)
+
+	return out.reshape(-1)[:count]
+
+
+# Palette indices of the (w x h) region of a packed frame whose top left corner is at
+# (x, y), the inverse of patch_packed with the same byte alignment rules.
+# packed can be any buffer, only the bytes under the region are read.
+def unpack_region(packed, frame_width: int, bpp: int, x: int, y: int, w: int, h: int) -> np.ndarray:
+	per_byte: int = 8 // bpp
+	if x % per_byte != 0 or w % per_byte != 0 or frame_width % per_byte != 0:
+		raise ValueError(f"Region not byte aligned: {x=} {w=} {frame_width=} {bpp=}")
+
+	row_bytes: int = frame_width // per_byte
+	rows = np.frombuffer(packed, dtype=np.uint8).reshape(-1, row_bytes)
+	return unpack_indices(rows[y:y + h, x // per_byte:(x + w) // per_byte].tobytes(), bpp, w * h).reshape(h, w)
+
+
+# Overwrite the pixels of a packed frame (frame_width pixels per row) with region,
+# whose top left corner is at (x, y).
+# Only the bytes under the region are touched, so x and the region width must fall on
+# byte boundaries (multiples of 8 // bpp).
+def patch_packed(buffer: bytearray, frame_width: int, bpp: int, region: np.ndarray, x: int, y: int) -> None:
+	per_byte: int = 8 // bpp
+	h: int = region.shape[0]
+	w: int = region.shape[1]
+	if x % per_byte != 0 or w % per_byte != 0 or frame_width % per_byte != 0:
+		raise ValueError(f"Region not byte aligned: {x=} {w=} {frame_width=} {bpp=}")
+
+	row_bytes: int = frame_width // per_byte
+	rows = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, row_bytes)
+	rows[y:y + h, x // per_byte:(x + w) // per_byte] = np.frombuffer(pack_indices(region, bpp), dtype=np.uint8).reshape(h, -1)
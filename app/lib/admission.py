@@ -0,0 +1,71 @@
+import threading
+import time
+
+from logging import Logger, getLogger
+
+
+logger: Logger = getLogger(__name__)
+
+
+class AdmissionController:
+	'''
+	Bounds the work in flight by both a number of slots and a byte budget.
+	acquire waits up to a timeout for room and tells whether the work was admitted,
+	admitted work must release the same cost when done. A single cost larger than the
+	whole budget is admitted only when nothing else holds any bytes, so it cannot be
+	starved forever.
+	'''
+	def __init__(self, max_slots: int, max_bytes: int) -> None:
+		self.max_slots: int = max_slots
+		self.max_bytes: int = max_bytes
+		self.active_slots: int = 0
+		self.active_bytes: int = 0
+		self.admitted: int = 0
+		self.rejected: int = 0
+		self._cond: threading.Condition = threading.Condition()
+
+	def _fits(self, cost: int) -> bool:
+		if self.active_slots >= self.max_slots:
+			return False
+
+		return self.active_bytes == 0 or self.active_bytes + cost <= self.max_bytes
+
+	def acquire(self, cost: int, timeout: float) -> bool:
+		deadline: float = time.monotonic() + timeout
+
+		with self._cond:
+			while not self._fits(cost):
+				remaining: float = deadline - time.monotonic()
+				if remaining <= 0:
+					self.rejected += 1
+					logger.warning(f"Not admitted {cost=} {self.active_slots=} {self.active_bytes=}")
+					return False
+
+				self._cond.wait(remaining)
+
+			self.active_slots += 1
+			self.active_bytes += cost
+			self.admitted += 1
+			return True
+
+	def release(self, cost: int) -> None:
+		with self._cond:
+			self.active_slots -= 1
+			self.active_bytes -= cost
+			self._cond.notify_all()
+
+	def configure(self, max_slots: int, max_bytes: int) -> None:
+		with self._cond:
+			self.max_slots = max_slots
+			self.max_bytes = max_bytes
+			self._cond.notify_all()
+
+	def stats(self) -> dict:
+		return {
+			"slots": self.active_slots,
+			"maxSlots": self.max_slots,
+			"bytes": self.active_bytes,
+			"maxBytes": self.max_bytes,
+			"admitted": self.admitted,
+			"rejected": self.rejected,
+		}
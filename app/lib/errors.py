@@ -6,6 +6,7 @@ from flask import g
 from flask_restx import abort, fields
 from flask_restx._http import HTTPStatus
 from msgspec import Raw
+from werkzeug.exceptions import HTTPException
 
 from app import api
 
@@ -104,10 +105,17 @@ error_fields = api.model("Error", {
 })
 
 
-def api_abort(error_code: ErrorCode, **kwargs) -> NoReturn:
+# retry_after (seconds) is sent as the Retry-After header, for SERVICE_UNAVAILABLE and
+# the rate limiting codes
+def api_abort(error_code: ErrorCode, retry_after: int | None = None, **kwargs) -> NoReturn:
 	#logger.debug(f"{error_code=} {kwargs=}")
 	err = STANDARD_ERRORS[error_code]
 	kwargs["requestId"] = getattr(g, "request_id", None)
 	kwargs["errorCode"] = err["error_code"]
-	abort(err["status"].value, err["default_message"], **kwargs)
+	try:
+		abort(err["status"].value, err["default_message"], **kwargs)
+	except HTTPException as e:
+		if retry_after is not None:
+			e.retry_after = retry_after	# type: ignore
+		raise
 	raise RuntimeError("Unreachable")
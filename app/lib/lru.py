@@ -0,0 +1,107 @@
+import threading
+
+from collections import OrderedDict
+from logging import Logger, getLogger
+from typing import Callable, Generic, Hashable, TypeVar
+
+
+logger: Logger = getLogger(__name__)
+
+
+V = TypeVar("V")
+
+
+class ByteLRU(Generic[V]):
+	'''
+	Least recently used cache bounded by the total size of its values in bytes
+	instead of the number of entries.
+	Values larger than the whole budget are not stored. Safe to share between the
+	request threads.
+	'''
+	def __init__(self, max_bytes: int, size_of: Callable[[V], int] = len) -> None:
+		self.max_bytes: int = max_bytes
+		self.size_of: Callable[[V], int] = size_of
+		self.current_bytes: int = 0
+		self.hits: int = 0
+		self.misses: int = 0
+		self.evictions: int = 0
+		self._entries: OrderedDict[Hashable, tuple[V, int]] = OrderedDict()
+		self._lock: threading.Lock = threading.Lock()
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	def __contains__(self, key: Hashable) -> bool:
+		return key in self._entries
+
+	def get(self, key: Hashable) -> V | None:
+		with self._lock:
+			entry: tuple[V, int] | None = self._entries.get(key)
+			if entry is None:
+				self.misses += 1
+				return None
+
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return entry[0]
+
+	def put(self, key: Hashable, value: V) -> None:
+		size: int = self.size_of(value)
+
+		with self._lock:
+			self._remove(key)
+
+			if size > self.max_bytes:
+				logger.debug(f"Value too large to cache {key=} {size=} {self.max_bytes=}")
+				return
+
+			self._entries[key] = (value, size)
+			self.current_bytes += size
+			self._evict()
+
+	def discard(self, key: Hashable) -> None:
+		with self._lock:
+			self._remove(key)
+
+	# Drop every entry whose key matches predicate
+	def discard_if(self, predicate: Callable[[Hashable], bool]) -> int:
+		with self._lock:
+			keys: list[Hashable] = [key for key in self._entries if predicate(key)]
+			for key in keys:
+				self._remove(key)
+
+			return len(keys)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+			self.current_bytes = 0
+
+	def resize(self, max_bytes: int) -> None:
+		with self._lock:
+			self.max_bytes = max_bytes
+			self._evict()
+
+	def stats(self) -> dict:
+		lookups: int = self.hits + self.misses
+		return {
+			"entries": len(self._entries),
+			"bytes": self.current_bytes,
+			"maxBytes": self.max_bytes,
+			"hits": self.hits,
+			"misses": self.misses,
+			"hitRate": self.hits / lookups if lookups > 0 else 0.0,
+			"evictions": self.evictions,
+		}
+
+	def _remove(self, key: Hashable) -> None:
+		entry: tuple[V, int] | None = self._entries.pop(key, None)
+		if entry is not None:
+			self.current_bytes -= entry[1]
+
+	# Drop the least recently used entries until the cache fits its budget
+	def _evict(self) -> None:
+		while self.current_bytes > self.max_bytes:
+			_, (_, evicted_size) = self._entries.popitem(last=False)
+			self.current_bytes -= evicted_size
+			self.evictions += 1
@@ -54,6 +54,10 @@ def init_app(app: Flask) -> None:
 	logger.info(f"Initializing redis client")
 	global redis_client
 	redis_client = FlaskRedis(app, decode_responses=True)
+	
+	# Frame payloads are raw bytes, they go through a second pool without response decoding
+	global redis_binary_client
+	redis_binary_client = FlaskRedis(app, config_prefix="REDIS_BINARY")
 
 
 '''
@@ -93,8 +97,34 @@ def rset(key: str, value: str) -> None:
 	redis_client[key] = value
 
 
+def rdelete_match(pattern: str) -> int:
+	global redis_client
+	keys: list[str] = list(redis_client.scan_iter(match=pattern))
+	if len(keys) > 0:
+		redis_client.delete(*keys)
+	
+	return len(keys)
+
+
 def rpublish(ch: str, msg: str) -> None:
 	logger.info(f"{ch=} {len(msg)=}")
 	
 	global redis_client
 	redis_client.publish(ch, msg)
+
+
+def rget_bytes(key: str) -> bytes | None:
+	global redis_binary_client
+	return redis_binary_client.get(key)
+
+
+def rsetex_bytes(key: str, value: bytes, ttl: int) -> None:
+	global redis_binary_client
+	redis_binary_client.setex(key, ttl, value)
+
+
+def rpublish_bytes(ch: str, msg: bytes) -> None:
+	logger.info(f"{ch=} {len(msg)=}")
+	
+	global redis_binary_client
+	redis_binary_client.publish(ch, msg)
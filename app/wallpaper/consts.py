@@ -1 +1,76 @@
+from enum import Enum
+
+
 ALLOWED_EXTENSIONS: tuple[str, ...] = ("png", "jpg", "jpeg", "bmp")
+
+
+class DitherMethod(Enum):
+	FLOYD_STEINBERG = "FLOYD_STEINBERG"
+	ATKINSON = "ATKINSON"
+	SIERRA_LITE = "SIERRA_LITE"
+	BAYER = "BAYER"
+	NEAREST = "NEAREST"
+
+
+DEFAULT_DITHER_METHOD: DitherMethod = DitherMethod.FLOYD_STEINBERG
+
+
+# How the canvas around the (scaled) image is filled
+class BackgroundFill(Enum):
+	BLUR = "BLUR"
+	SOLID = "SOLID"
+	MIRROR = "MIRROR"
+	GRADIENT = "GRADIENT"
+
+
+DEFAULT_BACKGROUND_FILL: BackgroundFill = BackgroundFill.BLUR
+
+
+# Version of the processing pipeline (resize, blur, dither) recorded in packed wallpaper
+# files, bump when processing changes so older files can be told apart
+WALLPAPER_PIPELINE_VERSION: int = 2
+
+
+class JobStatus(Enum):
+	QUEUED = "QUEUED"
+	RUNNING = "RUNNING"
+	DONE = "DONE"
+	FAILED = "FAILED"
+
+
+# Request size limit of a batch upload, if not set in the config. The files are streamed
+# to disk, not held in memory
+DEFAULT_BATCH_MAX_CONTENT_LENGTH: int = 512 * 1024 * 1024 # 512 MB
+
+# Suffix of uploaded files waiting in the upload dir for a worker
+UPLOAD_SOURCE_SUFFIX: str = ".src"
+
+
+# Worker processes processing uploads, if not set in the config
+DEFAULT_JOB_WORKERS: int = 2
+
+# Seconds a finished job can still be looked up
+JOB_RETENTION: int = 60 * 60
+
+# Added to the nice value of the job workers, so ticks and requests win the CPU
+JOB_WORKER_NICENESS: int = 10
+
+
+# Admission of new jobs, if not set in the config: jobs in flight (queued or running)
+# default to the number of cores, their estimated memory to DEFAULT_ADMISSION_MAX_BYTES
+DEFAULT_ADMISSION_MAX_BYTES: int = 256 * 1024 * 1024 # 256 MB
+
+# Seconds a request waits for room before it is turned away
+DEFAULT_ADMISSION_WAIT: float = 5.0
+
+# Seconds a turned away client is told to wait (Retry-After)
+ADMISSION_RETRY_AFTER: int = 10
+
+# Estimated working memory of the pipeline: bytes per decoded pixel (the decoded image
+# and resized copies of it) and per canvas pixel (fill, float dithering buffers)
+INGEST_BYTES_PER_DECODED_PIXEL: int = 8
+INGEST_BYTES_PER_CANVAS_PIXEL: int = 48
+
+
+# Bytes read at a time when hashing source images
+HASH_CHUNK_SIZE: int = 1024 * 1024 # 1 MB
@@ -0,0 +1,163 @@
+from logging import Logger, getLogger
+from typing import Callable, Sequence
+
+import numpy as np
+
+from PIL.Image import Image
+from PIL import Image as Img
+
+from .consts import DitherMethod
+
+
+logger: Logger = getLogger(__name__)
+
+
+# Error diffusion kernels as (row offset, column offset, weight)
+FLOYD_STEINBERG_KERNEL: tuple[tuple[int, int, float], ...] = (
+	(0, 1, 7 / 16),
+	(1, -1, 3 / 16), (1, 0, 5 / 16), (1, 1, 1 / 16),
+)
+
+# Atkinson only pushes 6/8 of the error forward, trading shadow detail for contrast
+ATKINSON_KERNEL: tuple[tuple[int, int, float], ...] = (
+	(0, 1, 1 / 8), (0, 2, 1 / 8),
+	(1, -1, 1 / 8), (1, 0, 1 / 8), (1, 1, 1 / 8),
+	(2, 0, 1 / 8),
+)
+
+SIERRA_LITE_KERNEL: tuple[tuple[int, int, float], ...] = (
+	(0, 1, 2 / 4),
+	(1, -1, 1 / 4), (1, 0, 1 / 4),
+)
+
+# 4x4 Bayer threshold map
+BAYER_MATRIX = np.array([
+	[0, 8, 2, 10],
+	[12, 4, 14, 6],
+	[3, 11, 1, 9],
+	[15, 7, 13, 5],
+], dtype=np.float32)
+
+
+# Amplitude of the Bayer threshold map, one step of a palette built from 2 levels per channel
+BAYER_SPREAD: float = 1.0
+
+
+def _nearest_index(values: np.ndarray, palette: np.ndarray) -> np.ndarray:
+	# argmin |v - p|^2 == argmin (|p|^2 - 2 v.p), which is a single matrix product
+	return np.argmin(np.sum(palette * palette, axis=1) - 2 * (values @ palette.T), axis=-1)
+
+
+# Error diffusion with the given kernel onto the colors in palette, returns the palette
+# position picked for every pixel.
+# https://scipython.com/blog/floyd-steinberg-dithering/
+#
+# Instead of visiting one pixel at a time, pixels are visited in diagonal wavefronts
+# (column + 2 * row). For every kernel above a pixel only receives error from pixels on
+# earlier wavefronts, so a whole wavefront is quantized with a single slice, reducing the
+# Python loop from width * height iterations to width + 2 * height.
+# With a float64 buffer this is bit exact with the per-pixel scanline version. The float32
+# buffer used here flips the odd pixel sitting on a quantization threshold, and error
+# diffusion carries that flip forward, so the dot pattern differs but the average colour
+# of any 16x16 block stays within 9/255 of the scanline version (mean < 0.5/255).
+def _error_diffuse(arr: np.ndarray, palette: np.ndarray, kernel: tuple[tuple[int, int, float], ...]) -> np.ndarray:
+	h: int = arr.shape[0]
+	w: int = arr.shape[1]
+
+	# Pad the sides and the bottom so error pushed past the border lands in the
+	# padding and is ignored, same as the scanline version
+	pad_l: int = max(0, -min(dc for _, dc, _ in kernel))
+	pad_r: int = max(0, max(dc for _, dc, _ in kernel))
+	pad_b: int = max(dr for dr, _, _ in kernel)
+	stride: int = pad_l + w + pad_r
+
+	buf = np.zeros((h + pad_b, stride, 3), dtype=np.float32)
+	buf[:h, pad_l:pad_l + w] = arr
+	flat = buf.reshape(-1, 3)
+
+	out = np.zeros((h + pad_b, stride), dtype=np.uint8)
+	out_flat = out.reshape(-1)
+
+	taps: list[tuple[int, np.float32]] = [(dr * stride + dc, np.float32(weight)) for dr, dc, weight in kernel]
+	rows = np.arange(h)
+
+	for t in range(w + 2 * (h - 1)):
+		# rows whose column (t - 2 * row) is inside the image
+		rs = rows[max(0, (t - w + 2) // 2):min(h - 1, t // 2) + 1]
+		idx = rs * stride + (t - 2 * rs) + pad_l
+
+		old_val = flat[idx]
+		new_pos = _nearest_index(old_val, palette)
+		out_flat[idx] = new_pos
+		err = old_val - palette[new_pos]
+
+		# Each kernel tap is a separate scatter so that no index repeats within one add
+		for offset, weight in taps:
+			flat[idx + offset] += err * weight
+
+	return out[:h, pad_l:pad_l + w]
+
+
+def _floyd_steinberg(arr: np.ndarray, palette: np.ndarray) -> np.ndarray:
+	return _error_diffuse(arr, palette, FLOYD_STEINBERG_KERNEL)
+
+
+def _atkinson(arr: np.ndarray, palette: np.ndarray) -> np.ndarray:
+	return _error_diffuse(arr, palette, ATKINSON_KERNEL)
+
+
+def _sierra_lite(arr: np.ndarray, palette: np.ndarray) -> np.ndarray:
+	return _error_diffuse(arr, palette, SIERRA_LITE_KERNEL)
+
+
+# Ordered dithering, every pixel is nudged by its threshold from the tiled Bayer map
+# and then mapped to the nearest color, so the whole frame is a handful of array operations
+def _bayer(arr: np.ndarray, palette: np.ndarray) -> np.ndarray:
+	h: int = arr.shape[0]
+	w: int = arr.shape[1]
+	n: int = BAYER_MATRIX.shape[0]
+
+	threshold = (BAYER_MATRIX + 0.5) / (n * n) - 0.5
+	threshold = np.tile(threshold, (h // n + 1, w // n + 1))[:h, :w, np.newaxis]
+
+	return _nearest_index(arr + threshold * BAYER_SPREAD, palette)
+
+
+# Simple palette reduction without dithering.
+def _nearest(arr: np.ndarray, palette: np.ndarray) -> np.ndarray:
+	return _nearest_index(arr, palette)
+
+
+DITHERERS: dict[DitherMethod, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+	DitherMethod.FLOYD_STEINBERG: _floyd_steinberg,
+	DitherMethod.ATKINSON: _atkinson,
+	DitherMethod.SIERRA_LITE: _sierra_lite,
+	DitherMethod.BAYER: _bayer,
+	DitherMethod.NEAREST: _nearest,
+}
+
+
+def to_pil_palette(palette: Sequence[tuple[int, int, int] | None]) -> list[int]:
+	flat: list[int] = []
+	for color in palette:
+		flat.extend(color or (0, 0, 0))
+		
+	return flat + [0] * (768 - len(flat))
+
+
+# Dither the image img onto palette using method.
+# Unsupported palette entries (None) are never picked. The result is a "P" image whose
+# pixel values are positions in palette, so they can be handed to the panel as is.
+def dither(img: Image, palette: Sequence[tuple[int, int, int] | None], method: DitherMethod) -> Image:
+	logger.debug(f"{method=} {palette=}")
+
+	usable: list[int] = [i for i, color in enumerate(palette) if color is not None]
+	colors = np.array([palette[i] for i in usable], dtype=np.float32) / 255
+
+	arr = np.asarray(img.convert("RGB"), dtype=np.float32) / 255
+	positions = DITHERERS[method](arr, colors)
+	indices = np.array(usable, dtype=np.uint8)[positions]
+
+	out: Image = Img.fromarray(indices)
+	out.putpalette(to_pil_palette(palette))
+	return out
@@ -0,0 +1,126 @@
+from logging import Logger, getLogger
+from typing import Callable
+
+import numpy as np
+
+from PIL.Image import Image
+from PIL import Image as Img
+from PIL import ImageFilter
+
+from .consts import BackgroundFill
+
+
+logger: Logger = getLogger(__name__)
+
+
+# Radius of the background blur, in canvas pixels
+BLUR_RADIUS: float = 4.0
+
+# The blur is done this many times smaller than the canvas and scaled back up, a blurred
+# image has no detail left that the lower resolution could lose
+BLUR_DOWNSCALE: int = 4
+
+# Longest side the image is reduced to before looking for its colors
+COLOR_SAMPLE_SIZE: int = 64
+
+# Bits kept per channel when binning colors for the dominant color
+COLOR_BIN_BITS: int = 4
+
+
+# Scale image to cover size (keeping its aspect ratio) and crop the center
+def _cover(image: Image, size: tuple[int, int], resample: Img.Resampling) -> Image:
+	ratio: float = max(size[0] / image.width, size[1] / image.height)
+	w: int = max(size[0], int(image.width * ratio))
+	h: int = max(size[1], int(image.height * ratio))
+
+	l: int = int((w - size[0]) * 0.5)
+	t: int = int((h - size[1]) * 0.5)
+	return image.resize((w, h), resample=resample).crop((l, t, l + size[0], t + size[1]))
+
+
+def _color_sample(image: Image) -> np.ndarray:
+	sample: Image = image.convert("RGB")
+	sample.thumbnail((COLOR_SAMPLE_SIZE, COLOR_SAMPLE_SIZE), Img.Resampling.BILINEAR)
+	return np.asarray(sample, dtype=np.uint8)
+
+
+# Image scaled to cover the canvas and blurred
+def _blur(image: Image, fg: Image, fg_offset: tuple[int, int], canvas_size: tuple[int, int]) -> Image:
+	small_size: tuple[int, int] = (
+		max(1, canvas_size[0] // BLUR_DOWNSCALE),
+		max(1, canvas_size[1] // BLUR_DOWNSCALE),
+	)
+	small: Image = _cover(image.convert("RGB"), small_size, Img.Resampling.BILINEAR)
+	small = small.filter(ImageFilter.GaussianBlur(radius=BLUR_RADIUS / BLUR_DOWNSCALE))
+
+	return small.resize(canvas_size, resample=Img.Resampling.BICUBIC)
+
+
+# Single color, the most common color of the image binned to COLOR_BIN_BITS per channel
+def _solid(image: Image, fg: Image, fg_offset: tuple[int, int], canvas_size: tuple[int, int]) -> Image:
+	pixels: np.ndarray = _color_sample(image).reshape(-1, 3)
+
+	shift: int = 8 - COLOR_BIN_BITS
+	bins: np.ndarray = pixels >> shift
+	bin_ids: np.ndarray = (bins[:, 0].astype(np.int32) << (2 * COLOR_BIN_BITS)) | (bins[:, 1].astype(np.int32) << COLOR_BIN_BITS) | bins[:, 2]
+	dominant: int = int(np.argmax(np.bincount(bin_ids)))
+
+	# average of the pixels in the bin instead of the bin corner
+	color = pixels[bin_ids == dominant].mean(axis=0).round().astype(np.uint8)
+	return Img.new("RGB", canvas_size, tuple(int(c) for c in color))
+
+
+# Foreground reflected at its edges until it covers the canvas
+def _mirror(image: Image, fg: Image, fg_offset: tuple[int, int], canvas_size: tuple[int, int]) -> Image:
+	arr: np.ndarray = np.asarray(fg.convert("RGB"), dtype=np.uint8)
+	x, y = fg_offset
+
+	# parts of the foreground outside of the canvas are cropped, the rest padded
+	l: int = max(0, -x)
+	t: int = max(0, -y)
+	r: int = min(fg.width, canvas_size[0] - x)
+	b: int = min(fg.height, canvas_size[1] - y)
+	if r <= l or b <= t:
+		return _blur(image, fg, fg_offset, canvas_size)
+
+	arr = arr[t:b, l:r]
+	pad_l: int = max(0, x)
+	pad_t: int = max(0, y)
+	pad_r: int = canvas_size[0] - pad_l - arr.shape[1]
+	pad_b: int = canvas_size[1] - pad_t - arr.shape[0]
+
+	return Img.fromarray(np.pad(arr, ((pad_t, pad_b), (pad_l, pad_r), (0, 0)), mode="symmetric"))
+
+
+# Vertical gradient from the average color of the top of the image to that of the bottom
+def _gradient(image: Image, fg: Image, fg_offset: tuple[int, int], canvas_size: tuple[int, int]) -> Image:
+	sample: np.ndarray = _color_sample(image).astype(np.float32)
+	band: int = max(1, sample.shape[0] // 8)
+	top: np.ndarray = sample[:band].mean(axis=(0, 1))
+	bottom: np.ndarray = sample[-band:].mean(axis=(0, 1))
+
+	steps: np.ndarray = np.linspace(0.0, 1.0, canvas_size[1], dtype=np.float32)[:, None]
+	column: np.ndarray = (top + (bottom - top) * steps).round().astype(np.uint8)
+
+	return Img.fromarray(np.ascontiguousarray(np.broadcast_to(column[:, None, :], (canvas_size[1], canvas_size[0], 3))))
+
+
+FILLERS: dict[BackgroundFill, Callable[[Image, Image, tuple[int, int], tuple[int, int]], Image]] = {
+	BackgroundFill.BLUR: _blur,
+	BackgroundFill.SOLID: _solid,
+	BackgroundFill.MIRROR: _mirror,
+	BackgroundFill.GRADIENT: _gradient,
+}
+
+
+# RGB background of canvas_size for image, fg is the image as it is pasted at fg_offset
+def fill_background(
+	image: Image,
+	fg: Image,
+	fg_offset: tuple[int, int],
+	canvas_size: tuple[int, int],
+	method: BackgroundFill
+) -> Image:
+	logger.debug(f"Filling background {method=} {canvas_size=}")
+
+	return FILLERS[method](image, fg, fg_offset, canvas_size)
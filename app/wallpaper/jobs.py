@@ -0,0 +1,276 @@
+import functools
+import multiprocessing
+import os
+import threading
+import uuid
+
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from logging import Logger, getLogger
+from typing import Any, Callable
+
+from flask import Flask, current_app
+from pytz import timezone
+
+from app.lib.admission import AdmissionController
+from app.lib.errors import api_abort, ErrorCode
+
+from .consts import *
+
+
+logger: Logger = getLogger(__name__)
+
+
+'''
+Image processing jobs run off the request threads, in a bounded pool of worker
+processes so a slow dither neither holds a server thread nor the GIL.
+A job runs fn(*args) in a worker (or one fn call per item of a batch, in parallel),
+then on_done back in this process inside an app context (DB writes etc.), whatever
+on_done returns is the job result. on_done runs on a thread of its own, not on the
+thread of the pool that hands out the results of all jobs.
+A pool left broken by a dead worker (e.g. killed for memory) is replaced on the next
+submit, the items it was running fail.
+Jobs are kept in memory, finished ones for JOB_RETENTION seconds.
+Every job holds an admission slot and its estimated cost in bytes from submission until
+it finishes, requests that find no room within the wait are turned away with
+SERVICE_UNAVAILABLE, so a burst of uploads cannot drive the Pi into swap.
+'''
+executor: ProcessPoolExecutor | None = None
+executor_lock: threading.Lock = threading.Lock()
+finisher: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-finish")
+admission: AdmissionController = AdmissionController(os.cpu_count() or 1, DEFAULT_ADMISSION_MAX_BYTES)
+admission_wait: float = DEFAULT_ADMISSION_WAIT
+jobs: dict[str, dict] = {}
+futures: dict[str, list[Future]] = {}
+jobs_lock: threading.Lock = threading.Lock()
+
+
+def init_app(app: Flask) -> None:
+	global admission_wait
+	
+	admission.configure(
+		app.config.get("WALLPAPER_ADMISSION_MAX_JOBS", os.cpu_count() or 1),
+		app.config.get("WALLPAPER_ADMISSION_MAX_BYTES", DEFAULT_ADMISSION_MAX_BYTES),
+	)
+	admission_wait = app.config.get("WALLPAPER_ADMISSION_WAIT", DEFAULT_ADMISSION_WAIT)
+	
+	logger.info(f"Job admission {admission.max_slots=} {admission.max_bytes=} {admission_wait=}")
+
+
+# Pool of worker processes for the image pipeline
+def create_pool(max_workers: int) -> ProcessPoolExecutor:
+	# not fork, forking the threaded server can copy locks other threads hold. Workers are
+	# started by a fork server that imports the pipeline once. They also import the main
+	# module (clockpi.py only serves under __main__), so that must stay safe to import
+	mp_context = multiprocessing.get_context("forkserver")
+	mp_context.set_forkserver_preload(["app.wallpaper.utils"])
+	
+	return ProcessPoolExecutor(
+		max_workers=max_workers,
+		mp_context=mp_context,
+		initializer=os.nice,
+		initargs=(JOB_WORKER_NICENESS,),
+	)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+	global executor
+
+	with executor_lock:
+		if executor is None:
+			max_workers: int = current_app.config.get("WALLPAPER_JOB_WORKERS", DEFAULT_JOB_WORKERS)
+			executor = create_pool(max_workers)
+			logger.info(f"Started job pool {max_workers=}")
+
+		return executor
+
+
+# Drop pool if it is still the current one, the next _get_executor starts a new one
+def _reset_executor(pool: ProcessPoolExecutor) -> None:
+	global executor
+
+	with executor_lock:
+		if executor is pool:
+			executor = None
+	
+	logger.warning(f"Job pool broken, replacing it")
+	pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Submit fn(*args) for every args of args_list, on a new pool if the current one broke
+def _submit_all(fn: Callable, args_list: list[tuple]) -> list[Future]:
+	pool: ProcessPoolExecutor = _get_executor()
+	submitted: list[Future] = []
+	try:
+		for args in args_list:
+			submitted.append(pool.submit(fn, *args))
+	
+	except BrokenProcessPool:
+		for future in submitted:
+			future.cancel()
+		_reset_executor(pool)
+		
+		pool = _get_executor()
+		submitted = [pool.submit(fn, *args) for args in args_list]
+	
+	return submitted
+
+
+def _now() -> datetime:
+	return datetime.now(timezone("Asia/Singapore"))
+
+
+def _prune_jobs() -> None:
+	expired_before: datetime = _now() - timedelta(seconds=JOB_RETENTION)
+	with jobs_lock:
+		for job_id in [job_id for job_id, job in jobs.items() if job["finishedAt"] is not None and job["finishedAt"] < expired_before]:
+			del jobs[job_id]
+
+
+def _finish_job(job_id: str, **values) -> None:
+	with jobs_lock:
+		jobs[job_id].update(values, finishedAt=_now())
+		futures.pop(job_id, None)
+
+
+# Error message of a failed item or job, api_abort raises HTTPExceptions so keep their
+# description
+def describe_error(ex: BaseException) -> str:
+	return getattr(ex, "description", None) or str(ex) or type(ex).__name__
+
+
+# Job of a single fn(*args), on_done gets its result. cost is the estimated peak memory
+# of the job in bytes.
+def submit_job(device_id: int, fn: Callable, args: tuple, on_done: Callable[[Any], dict], cost: int) -> dict:
+	def on_batch_done(results: list[Any]) -> dict:
+		if isinstance(results[0], BaseException):
+			raise results[0]
+		
+		return on_done(results[0])
+	
+	return submit_batch_job(device_id, fn, [args], on_batch_done, [cost])
+
+
+# Job of fn(*args) for every args of args_list, spread over the workers. on_done gets
+# the results in the same order, the exception for the items that failed, once all of
+# them finished. costs are the estimated peak memory of every item.
+def submit_batch_job(
+	device_id: int,
+	fn: Callable,
+	args_list: list[tuple],
+	on_done: Callable[[list[Any]], dict],
+	costs: list[int]
+) -> dict:
+	_prune_jobs()
+	
+	# only as many items as there are workers are processed at the same time
+	max_workers: int = current_app.config.get("WALLPAPER_JOB_WORKERS", DEFAULT_JOB_WORKERS)
+	cost: int = sum(sorted(costs)[-max_workers:])
+	
+	if not admission.acquire(cost, admission_wait):
+		api_abort(ErrorCode.SERVICE_UNAVAILABLE, retry_after=ADMISSION_RETRY_AFTER, detail="Too many images are being processed, try again later")
+
+	job_id: str = uuid.uuid4().hex
+	with jobs_lock:
+		jobs[job_id] = {
+			"id": job_id,
+			"deviceId": device_id,
+			"status": JobStatus.QUEUED.value,
+			"done": 0,
+			"total": len(args_list),
+			"createdAt": _now(),
+			"finishedAt": None,
+			"result": None,
+			"error": None,
+		}
+
+	app: Flask = current_app._get_current_object()	# type: ignore
+	results: list[Any] = [None] * len(args_list)
+	remaining: list[int] = [len(args_list)]
+
+	def finish() -> None:
+		try:
+			with app.app_context():
+				values: dict = on_done(results)
+
+			_finish_job(job_id, status=JobStatus.DONE.value, result=values)
+			logger.info(f"Job done {job_id=} {values=}")
+
+		except Exception as ex:
+			error: str = describe_error(ex)
+			_finish_job(job_id, status=JobStatus.FAILED.value, error=error)
+			logger.error(f"Job failed {job_id=}: {error}")
+		
+		finally:
+			admission.release(cost)
+
+	def done(index: int, future: Future) -> None:
+		try:
+			results[index] = future.result()
+		except Exception as ex:
+			results[index] = ex
+		
+		with jobs_lock:
+			jobs[job_id]["done"] += 1
+			remaining[0] -= 1
+			is_last: bool = remaining[0] == 0
+		
+		# off the pool thread, it hands out the results of every job
+		if is_last:
+			finisher.submit(finish)
+
+	try:
+		submitted: list[Future] = _submit_all(fn, args_list)
+	except Exception:
+		admission.release(cost)
+		_finish_job(job_id, status=JobStatus.FAILED.value, error="Unable to start job")
+		raise
+	
+	with jobs_lock:
+		futures[job_id] = submitted
+	for index, future in enumerate(submitted):
+		future.add_done_callback(functools.partial(done, index))
+
+	logger.info(f"Job submitted {job_id=} {device_id=} {len(args_list)=}")
+	return get_job(job_id) or {}
+
+
+# Job that is done as it is submitted, for uploads with nothing left to process. on_done
+# still runs, right away.
+def submit_done_job(device_id: int, on_done: Callable[[], dict]) -> dict:
+	_prune_jobs()
+	
+	values: dict = on_done()
+	
+	job_id: str = uuid.uuid4().hex
+	now: datetime = _now()
+	with jobs_lock:
+		jobs[job_id] = {
+			"id": job_id,
+			"deviceId": device_id,
+			"status": JobStatus.DONE.value,
+			"done": 0,
+			"total": 0,
+			"createdAt": now,
+			"finishedAt": now,
+			"result": values,
+			"error": None,
+		}
+	
+	logger.info(f"Job done {job_id=} {values=}")
+	return get_job(job_id) or {}
+
+
+def get_job(job_id: str) -> dict | None:
+	with jobs_lock:
+		job: dict | None = jobs.get(job_id)
+		if job is None:
+			return None
+		
+		job = dict(job)
+		submitted: list[Future] = futures.get(job_id, [])
+		if job["status"] == JobStatus.QUEUED.value and any(future.running() or future.done() for future in submitted):
+			job["status"] = JobStatus.RUNNING.value
+		
+		return job
@@ -1,6 +1,5 @@
 import hashlib
 import os
-import shutil
 
 from datetime import datetime
 from logging import Logger, getLogger
@@ -9,17 +8,22 @@ from typing import Sequence
 from pytz import timezone
 from sqlalchemy import and_, delete, select
 from werkzeug.datastructures import FileStorage, ImmutableMultiDict
+from werkzeug.utils import secure_filename
 
 from app import db
 from app.consts import *
 from app.device.logic import can_access_device
 from app.device.models import DeviceModel
 from app.epd7in3e.consts import *
-from app.device.logic.queue import append_to_queue, remove_all_from_queue, remove_from_queue
+from app.frame.cache import invalidate_device_frames
+from app.device.logic.queue import append_all_to_queue, remove_all_from_queue, remove_from_queue
 from app.lib.errors import api_abort, ErrorCode
 
+from .consts import DEFAULT_BACKGROUND_FILL, BackgroundFill
 from .models import WallpaperModel, WallpaperOwnershipModel
-from .utils import save_upload_file, validate_image, process_image
+from .jobs import describe_error, submit_batch_job, submit_done_job, submit_job
+from .store import discard_staged_files, find_asset, place_files, release_files
+from .utils import IngestParams, StoredWallpaper, check_upload_file, estimate_ingest_bytes, get_asset_key, ingest_image, ingest_image_file, is_background_fill_valid, is_upload_file_valid, probe_image, save_upload_file
 
 
 logger: Logger = getLogger(__name__)
@@ -43,153 +47,300 @@ def can_access_wallpaper(user_id: int, device_id: int, wallpaper_id: int | None)
 	return True
 
 
+# Validate the placement fields of an upload, returns (image scale, x, y, background fill)
+# or None with the errors added to failed_validations
+def _parse_placement(
+	img_scale_per_str: str | None,
+	x_pos_per_str: str | None,
+	y_pos_per_str: str | None,
+	background_fill_str: str,
+	failed_validations: dict,
+) -> tuple[float, float, float, BackgroundFill] | None:
+	values: list[float] = []
+	for field, value_str in (("imgScalePer", img_scale_per_str), ("xPosPer", x_pos_per_str), ("yPosPer", y_pos_per_str)):
+		if value_str is None:
+			failed_validations[field] = "This is a required field."
+			continue
+		
+		try:
+			values.append(float(value_str))
+		except ValueError as e:
+			failed_validations[field] = "Invalid input (float required)."
+	
+	if (err := is_background_fill_valid(background_fill_str)) is not None:
+		failed_validations["bgFill"] = err
+	
+	if len(values) < 3 or "bgFill" in failed_validations:
+		return None
+	
+	return values[0], values[1], values[2], BackgroundFill[background_fill_str]
+
+
+def _get_upload_device(user_id: int, device_id: int) -> DeviceModel:
+	device: DeviceModel | None = db.session.get(DeviceModel, device_id)
+	if device is None:
+		api_abort(ErrorCode.INVALID_DEPENDENCY, detail="Device not found")
+
+	if not can_access_device(user_id, device_id):
+		api_abort(ErrorCode.INVALID_DEPENDENCY, detail="Unable to access device")
+	
+	return device
+
+
 def create_wallpaper(
 	user_id:int,
 	device_id: int,
 	file: FileStorage | None,
 	form_data: ImmutableMultiDict
-) -> None:
+) -> dict:
 	logger.info(f"Attempting to create wallpaper: {user_id=} {device_id=} {file=} {form_data=}")
 	
-	img_scale_per_str: str | None = form_data.get("imgScalePer")
-	x_pos_per_str: str | None = form_data.get("xPosPer")
-	y_pos_per_str: str | None = form_data.get("yPosPer")
-
-	secured_file_name: str = save_upload_file(file)
+	secured_file_name: str = check_upload_file(file)
 	
 	failed_validations: dict = {}
+	placement = _parse_placement(
+		form_data.get("imgScalePer"),
+		form_data.get("xPosPer"),
+		form_data.get("yPosPer"),
+		form_data.get("bgFill", DEFAULT_BACKGROUND_FILL.value),
+		failed_validations,
+	)
 	
-	if img_scale_per_str is None:
-		failed_validations["imgScalePer"] = "This is a required field."
-	else:
-		try:
-			img_scale_per: float = float(img_scale_per_str)
-		except ValueError as e:
-			failed_validations["imgScalePer"] =  "Invalid input (float required)."
-	
-	if x_pos_per_str is None:
-		failed_validations["xPosPer"] = "This is a required field."
-	else:
-		try:
-			x_pos_per: float = float(x_pos_per_str)
-		except ValueError as e:
-			failed_validations["xPosPer"] =  "Invalid input (float required)."
-			
-	if y_pos_per_str is None:
-		failed_validations["yPosPer"] = "This is a required field."
-	else:
-		try:
-			y_pos_per: float = float(y_pos_per_str)
-		except ValueError as e:
-			failed_validations["yPosPer"] =  "Invalid input (float required)."
-	
-	if len(failed_validations.values()) > 0:
+	if placement is None:
 		api_abort(ErrorCode.VALIDATION_ERROR, errors=failed_validations)
 	
-	device: DeviceModel | None = db.session.get(DeviceModel, device_id)
-	if device is None:
-		api_abort(ErrorCode.INVALID_DEPENDENCY, detail="Device not found")
-
-	temp_upload_path: str = os.path.join(DIR_TMP_UPLOAD, secured_file_name)
-
-	# Remove temp file and abort if there are input errors	
-	if not can_access_device(user_id, device_id):
-		os.remove(temp_upload_path)
-		api_abort(ErrorCode.INVALID_DEPENDENCY, detail="Unable to access device")
+	device: DeviceModel = _get_upload_device(user_id, device_id)
 
-	# validate image
-	if not validate_image(temp_upload_path):
-		os.remove(path=temp_upload_path)
+	# cheap header check, so a file that is not an image is still rejected right away
+	probe: tuple[str, tuple[int, int]] | None = probe_image(file.stream)	# type: ignore
+	if probe is None:
 		logger.error(f"Invalid image file")
 		api_abort(ErrorCode.UNPROCESSABLE_ENTITY)
-
-	# process image
-	if not os.path.isdir(DIR_TMP_PROCESSED):
-		os.mkdir(DIR_TMP_PROCESSED)
-
-	temp_processed_path: str = os.path.join(DIR_TMP_PROCESSED, secured_file_name)
-	process_result: bool = process_image(
-		file_path=temp_upload_path,
-		dest_path=temp_processed_path,
+	
+	params: IngestParams = get_ingest_params(device, *placement)
+	name: str = secured_file_name.rsplit(".", 1)[0]
+	
+	# the request stream is closed once the response is sent, hand the worker the bytes
+	data: bytes = file.read()	# type: ignore
+	source_hash: str = hashlib.sha256(data).hexdigest()
+	asset_key: str = get_asset_key(source_hash, params)
+	
+	def on_done(result: tuple) -> dict:
+		return {"wallpaperId": add_wallpapers(user_id, device_id, [StoredWallpaper(name, source_hash, asset_key, *result)])[0]}
+	
+	# same image processed the same way before, for this or another device
+	asset: tuple[str, str, int] | None = find_asset(asset_key)
+	if asset is not None:
+		logger.info(f"Reusing stored wallpaper {asset[0]} for {asset_key=}")
+		return submit_done_job(device_id, lambda: on_done(asset))
+	
+	cost: int = len(data) + estimate_ingest_bytes(*probe, params)
+	return submit_job(device_id, ingest_image, (data, params, DIR_APP_UPLOAD), on_done, cost)
+
+
+# Upload several files in one job, processed in parallel. The placement fields are
+# given once for all files or once per file, in the order of the files.
+# Files that cannot be processed are reported in the job result instead of failing the
+# whole batch, the others are added in one transaction with a single queue update.
+# Files already stored with the same processing are not processed again, neither are
+# duplicates within the batch.
+# The files are streamed to the upload dir (a batch can be far larger than memory), the
+# workers read them from there, they are removed once the job is done.
+def create_wallpapers(
+	user_id: int,
+	device_id: int,
+	files: list[FileStorage],
+	form_data: ImmutableMultiDict
+) -> dict:
+	logger.info(f"Attempting to create wallpapers: {user_id=} {device_id=} {len(files)=} {form_data=}")
+	
+	if len(files) == 0:
+		api_abort(ErrorCode.INVALID_INPUT, errors={"files": "This is a required property"})
+	
+	failed_validations: dict = {}
+	field_values: dict[str, list[str]] = {}
+	for field in ("imgScalePer", "xPosPer", "yPosPer", "bgFill"):
+		values: list[str] = form_data.getlist(field)
+		if field == "bgFill" and len(values) == 0:
+			values = [DEFAULT_BACKGROUND_FILL.value]
+		
+		if len(values) not in (1, len(files)):
+			failed_validations[field] = f"Expected 1 or {len(files)} values, one per file."
+		field_values[field] = values
+	
+	if len(failed_validations.values()) > 0:
+		api_abort(ErrorCode.VALIDATION_ERROR, errors=failed_validations)
+	
+	device: DeviceModel = _get_upload_device(user_id, device_id)
+	
+	# (name, source hash, asset key, error, stored asset or index of the worker result)
+	# of every file, in upload order, and what is sent to the workers
+	outcomes: list[tuple[str, str, str, str | None, tuple | int | None]] = []
+	args_list: list[tuple] = []
+	costs: list[int] = []
+	pending: dict[str, int] = {}
+	source_paths: list[str] = []
+	
+	def remove_sources() -> None:
+		for path in source_paths:
+			if os.path.isfile(path):
+				os.remove(path)
+	
+	try:
+		for index, file in enumerate(files):
+			name: str = (file.filename or "").rsplit(".", 1)[0]
+			
+			def value(field: str) -> str:
+				values: list[str] = field_values[field]
+				return values[index] if len(values) > 1 else values[0]
+			
+			file_validations: dict = {}
+			placement = _parse_placement(value("imgScalePer"), value("xPosPer"), value("yPosPer"), value("bgFill"), file_validations)
+			error: str | None = is_upload_file_valid(file)
+			if error is None and placement is None:
+				error = "; ".join(f"{field}: {err}" for field, err in file_validations.items())
+			
+			probe: tuple[str, tuple[int, int]] | None = None
+			if error is None:
+				probe = probe_image(file.stream)
+				if probe is None:
+					error = "Invalid image file"
+			
+			if error is not None or placement is None or probe is None:
+				outcomes.append((name, "", "", error, None))
+				continue
+			
+			name = secure_filename(file.filename or "").rsplit(".", 1)[0]
+			params: IngestParams = get_ingest_params(device, *placement)
+			source_path, source_hash, source_size = save_upload_file(file, DIR_APP_UPLOAD)
+			source_paths.append(source_path)
+			asset_key: str = get_asset_key(source_hash, params)
+			
+			if asset_key not in pending:
+				asset: tuple[str, str, int] | None = find_asset(asset_key)
+				if asset is not None:
+					outcomes.append((name, source_hash, asset_key, None, asset))
+					continue
+				
+				pending[asset_key] = len(args_list)
+				args_list.append((source_path, params, DIR_APP_UPLOAD))
+				costs.append(source_size + estimate_ingest_bytes(*probe, params))
+			
+			outcomes.append((name, source_hash, asset_key, None, pending[asset_key]))
+		
+		if all(error is not None for _, _, _, error, _ in outcomes):
+			api_abort(ErrorCode.UNPROCESSABLE_ENTITY, errors={"files": [{"name": name, "error": error} for name, _, _, error, _ in outcomes]})
+		
+		def on_done(results: list) -> dict:
+			remove_sources()
+			
+			file_results: list[dict] = []
+			stored: list[StoredWallpaper] = []
+			for name, source_hash, asset_key, error, result in outcomes:
+				if isinstance(result, int):
+					result = results[result]
+				
+				if error is None:
+					if isinstance(result, BaseException):
+						error = describe_error(result)
+					else:
+						stored.append(StoredWallpaper(name, source_hash, asset_key, *result))	# type: ignore
+				
+				file_results.append({"name": name, "wallpaperId": None, "error": error})
+			
+			wallpaper_ids = iter(add_wallpapers(user_id, device_id, stored) if len(stored) > 0 else [])
+			for file_result in file_results:
+				if file_result["error"] is None:
+					file_result["wallpaperId"] = next(wallpaper_ids)
+			
+			return {"files": file_results}
+		
+		if len(args_list) == 0:
+			return submit_done_job(device_id, lambda: on_done([]))
+		
+		return submit_batch_job(device_id, ingest_image_file, args_list, on_done, costs)
+	
+	except BaseException:
+		remove_sources()
+		raise
+
+
+def get_ingest_params(
+	device: DeviceModel,
+	img_scale_per: float,
+	x_pos_per: float,
+	y_pos_per: float,
+	background_fill: BackgroundFill
+) -> IngestParams:
+	return IngestParams(
 		canvas_size=(device.width, device.height),
 		image_scale=img_scale_per,
 		image_offset=(int(device.width * x_pos_per), int(device.height * y_pos_per)),
-		nc=EPD_NC,
+		palette=EPD_PALETTE,
+		dither_method=device.dither_method,
+		background_fill=background_fill,
+		bpp=EPD_BPP,
+		palette_id=EPD_PALETTE_ID,
+		panel_size=EPD_DIMENSIONS,
 	)
 
-	if not process_result:
-		if os.path.isfile(temp_upload_path):
-			os.remove(temp_upload_path)
-		if os.path.isfile(temp_processed_path):
-			os.remove(temp_processed_path)
-		logger.error(f"Unable to proccess image")
-		api_abort(ErrorCode.INTERNAL_SERVER_ERROR)
 
-	# get hash of processed image
-	try:
-		h = hashlib.sha256()
-		with open(temp_processed_path, "rb") as f:
-			while True:
-				chunk = f.read(h.block_size)
-				if not chunk:
-					break
-				h.update(chunk)
-		hash: str = h.hexdigest()
-
-	except OSError as error:
-		if os.path.isfile(temp_upload_path):
-			os.remove(temp_upload_path)
-		if os.path.isfile(temp_processed_path):
-			os.remove(temp_processed_path)
-		logger.error(f"Unable to obtain file hash: {error}")
-		api_abort(ErrorCode.INTERNAL_SERVER_ERROR)
-
-	# copy processed image to upload dir
+# Create the wallpaper rows for stored files and append them to the device queue in a
+# single transaction. Returns the wallpaper IDs in the same order. The files are removed
+# again if they cannot be added.
+def add_wallpapers(user_id: int, device_id: int, files: list[StoredWallpaper]) -> list[int]:
 	try:
-		new_file_name: str = f"{hash[0:8]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.bmp"
-		dest_path: str = os.path.join(DIR_APP_UPLOAD, new_file_name)
-		logger.debug(f"{dest_path=}")
-		shutil.copy2(temp_processed_path, dest_path)
-		os.remove(temp_processed_path)
-
-	except OSError as error:
-		if os.path.isfile(temp_upload_path):
-			os.remove(temp_upload_path)
-		if os.path.isfile(temp_processed_path):
-			os.remove(temp_processed_path)
-		logger.error(f"Unable to copy file due to {error}")
-		api_abort(ErrorCode.INTERNAL_SERVER_ERROR)
-		return
-
-	# Save upload entry to DB
-	name: str = secured_file_name.rsplit(".", 1)[0]
-	file_size: int = os.path.getsize(dest_path)
-
-	# create new WallpaperModel
-	wm: WallpaperModel = WallpaperModel()
-	wm.name = name
-	wm.hash = hash
-	wm.file_name = new_file_name
-	wm.size = file_size
-	wm.color = device.default_label_color
-	wm.shadow = device.default_label_shadow
-	
-	db.session.add(wm)
-	db.session.flush()
-	
-	# create new WallpaperOwnershipModel
-	wom: WallpaperOwnershipModel = WallpaperOwnershipModel()
-	wom.wallpaper_id = wm.id
-	wom.user_id = user_id
-	wom.device_id = device_id
-	
-	db.session.add(wom)
-	db.session.flush()
+		device: DeviceModel | None = db.session.get(DeviceModel, device_id)
+		if device is None:
+			api_abort(ErrorCode.INVALID_DEPENDENCY, detail="Device not found")
+		
+		models: list[WallpaperModel] = []
+		for file in files:
+			# create new WallpaperModel
+			wm: WallpaperModel = WallpaperModel()
+			wm.name = file.name
+			wm.hash = file.hash
+			wm.source_hash = file.source_hash
+			wm.asset_key = file.asset_key
+			wm.file_name = file.file_name
+			wm.size = file.size
+			wm.color = device.default_label_color
+			wm.shadow = device.default_label_shadow
+			
+			db.session.add(wm)
+			models.append(wm)
+		
+		db.session.flush()
 
-	# this method will execute the commit()
-	append_to_queue(device_id, wm.id)
+		for wm in models:
+			# resolve the label layout once the label defaults are populated by the flush
+			wm.update_label_layout(device.type, device.width, device.height)
+			
+			# create new WallpaperOwnershipModel
+			wom: WallpaperOwnershipModel = WallpaperOwnershipModel()
+			wom.wallpaper_id = wm.id
+			wom.user_id = user_id
+			wom.device_id = device_id
+			
+			db.session.add(wom)
+		
+		db.session.flush()
+
+		# put the files in place, locked against release_files until the commit
+		place_files(files)
+
+		# this method will execute the commit()
+		append_all_to_queue(device_id, [wm.id for wm in models])
+	
+	except Exception:
+		db.session.rollback()
+		discard_staged_files(files)
+		release_files(file.file_name for file in files)
+		raise
 
-	logger.info(f"Processed image and created new wallpaper model")
+	wallpaper_ids: list[int] = [wm.id for wm in models]
+	logger.info(f"Processed images and created new wallpaper models {wallpaper_ids=}")
+	return wallpaper_ids
 
 
 def delete_all_wallpaper(user_id:int, device_id: int) -> None:
@@ -212,18 +363,10 @@ def delete_all_wallpaper(user_id:int, device_id: int) -> None:
 	# this method will execute the commit() too
 	remove_all_from_queue(device_id)
 	
-	# Delete wallpaper image files
+	# Delete wallpaper image files no other wallpaper shares
 	# Note: app will throw exception if commit failed when removing queue
 	# and do a rollback before stepping here
-	for file_name in file_names:
-		file_path: str = os.path.join(DIR_APP_UPLOAD, file_name)
-		if os.path.isfile(file_path):
-			try:
-				os.remove(file_path)
-			except Exception as ex:
-				logger.error(f"Unable to delete wallpaper file due to {ex}")
-		else:
-			logger.error(f"Unable to find wallpaper file {file_name} in {file_path}")
+	release_files(file_names)
 
 	logger.info(f"Deleted all wallpaper")
 	
@@ -231,8 +374,7 @@ def delete_all_wallpaper(user_id:int, device_id: int) -> None:
 def delete_wallpaper(device_id:int, wallpaper_id: int) -> None:
 	logger.info(msg=f"Attempting to delete wallpaper {wallpaper_id=}")
 	
-	file_name: str = db.session.scalars(select(WallpaperModel.file_name).where(WallpaperModel.id == wallpaper_id)).one_or_none() or ""
-	file_path: str = os.path.join(DIR_APP_UPLOAD, file_name)
+	file_name: str | None = db.session.scalars(select(WallpaperModel.file_name).where(WallpaperModel.id == wallpaper_id)).one_or_none()
 
 	# delete wallpaper ownership first (ForeignKey)
 	db.session.execute(delete(WallpaperOwnershipModel).where(WallpaperOwnershipModel.wallpaper_id == wallpaper_id))
@@ -245,16 +387,11 @@ def delete_wallpaper(device_id:int, wallpaper_id: int) -> None:
 	# this method will execute the commit() too
 	remove_from_queue(device_id, wallpaper_id)
 
-	# Delete wallpaper image files
+	# Delete the wallpaper image file, unless another wallpaper shares it
 	# Note: app will throw exception if commit failed when removing queue
 	# and do a rollback before stepping here
-	if os.path.isfile(file_path):
-		try:
-			os.remove(file_path)
-		except Exception as ex:
-			logger.error(f"Unable to delete wallpaper file due to {ex}")
-	else:
-		logger.error(f"Unable to find wallpaper file {file_name} in {file_path}")
+	if file_name is not None:
+		release_files([file_name])
 
 	logger.info(f"Deleted wallpaper {wallpaper_id=}")
 	
@@ -266,7 +403,11 @@ def update_wallpaper(device_id: int, wallpaper_id: int, payload: dict) -> None:
 	if wallpaper is None:
 		api_abort(ErrorCode.WALLPAPER_NOT_FOUND)
 	
-	supported_colors: list[str] = db.session.scalars(select(DeviceModel.supported_colors).where(DeviceModel.id == device_id)).one_or_none() or []
+	device: DeviceModel | None = db.session.get(DeviceModel, device_id)
+	if device is None:
+		api_abort(ErrorCode.DEVICE_NOT_FOUND)
+
+	supported_colors: list[str] = device.supported_colors
 	
 	failed_validations: dict = {}
 	
@@ -310,6 +451,7 @@ def update_wallpaper(device_id: int, wallpaper_id: int, payload: dict) -> None:
 		db.session.rollback();
 		api_abort(ErrorCode.VALIDATION_ERROR, errors=failed_validations)
 
+	wallpaper.update_label_layout(device.type, device.width, device.height)
 	wallpaper.updated_at = datetime.now(timezone("Asia/Singapore"))
 
 	try:
@@ -319,6 +461,9 @@ def update_wallpaper(device_id: int, wallpaper_id: int, payload: dict) -> None:
 		logger.error(f"DB commit failed: {ex}")
 		api_abort(ErrorCode.DATABASE_ERROR)
 
+	# frames prerendered with the previous label settings are no longer shown
+	invalidate_device_frames(device_id)
+
 	logger.info(f"Wallpaper {wallpaper_id=} updated")
 
 
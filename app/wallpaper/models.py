@@ -14,11 +14,17 @@ class WallpaperModel(db.Model):
 	'''
 	xy: pixel position of label
 	wh: width/height of label in percentage with respect to width/height of canvas
+	label_font_size/anchor/shadow: label layout resolved for the owning device,
+	NULL until resolved or after the device size changed
+	source_hash: sha256 of the original image file, NULL for wallpapers stored before it was recorded
+	asset_key: source image and processing that produced file_name, uploads with the same key share the file
 	'''
 	id: 			Mapped[int] 		= mapped_column(Integer, primary_key=True)
 	name:			Mapped[str] 		= mapped_column(String(), nullable=False)
 	hash: 			Mapped[str] 		= mapped_column(String(), nullable=False)
-	file_name:		Mapped[str] 		= mapped_column(String(), nullable=False)
+	source_hash:	Mapped[str | None]	= mapped_column(String(), nullable=True, index=True)
+	asset_key:		Mapped[str | None]	= mapped_column(String(), nullable=True, index=True)
+	file_name:		Mapped[str] 		= mapped_column(String(), nullable=False, index=True)
 	size: 			Mapped[int] 		= mapped_column(Integer, nullable=False)
 	label_x_per:	Mapped[float] 		= mapped_column(Float(precision=1), default=0.0, nullable=False)
 	label_y_per: 	Mapped[float] 		= mapped_column(Float(precision=1), default=0.0, nullable=False)
@@ -26,6 +32,11 @@ class WallpaperModel(db.Model):
 	label_h_per:	Mapped[float] 		= mapped_column(Float(precision=1), default=0.5, nullable=False)
 	color: 			Mapped[str] 		= mapped_column(String(), default="NONE", nullable=False)
 	shadow: 		Mapped[str]			= mapped_column(String(), default="NONE", nullable=False)
+	label_font_size:	Mapped[int | None]	= mapped_column(Integer, nullable=True)
+	label_anchor_x:		Mapped[int | None]	= mapped_column(Integer, nullable=True)
+	label_anchor_y:		Mapped[int | None]	= mapped_column(Integer, nullable=True)
+	label_shadow_x:		Mapped[float | None]	= mapped_column(Float(precision=1), nullable=True)
+	label_shadow_y:		Mapped[float | None]	= mapped_column(Float(precision=1), nullable=True)
 	created_at:		Mapped[datetime] 	= mapped_column(DateTime, nullable=False, default=datetime.now(timezone("Asia/Singapore")))
 	updated_at:		Mapped[datetime] 	= mapped_column(DateTime, nullable=True)
 
@@ -49,6 +60,8 @@ class WallpaperModel(db.Model):
 			id:{self.id} \
 			name:{self.name} \
 			hash:{self.hash} \
+			source_hash:{self.source_hash} \
+			asset_key:{self.asset_key} \
 			size:{self.size} \
 			file_name:{self.file_name} \
 			label_x_per:{self.label_x_per} \
@@ -57,10 +70,42 @@ class WallpaperModel(db.Model):
 			label_h_per:{self.label_h_per} \
 			color:{self.color} \
 			shadow:{self.shadow} \
+			label_font_size:{self.label_font_size} \
+			label_anchor_x:{self.label_anchor_x} \
+			label_anchor_y:{self.label_anchor_y} \
+			label_shadow_x:{self.label_shadow_x} \
+			label_shadow_y:{self.label_shadow_y} \
 			created_at:{self.created_at} \
 			updated_at:{self.updated_at}\
 			>"
 
+	def has_label_layout(self) -> bool:
+		return (
+			self.label_font_size is not None
+			and self.label_anchor_x is not None
+			and self.label_anchor_y is not None
+			and self.label_shadow_x is not None
+			and self.label_shadow_y is not None
+		)
+
+	def update_label_layout(self, device_type: str, width: int, height: int) -> None:
+		if device_type == "epd7in3e":
+			from app.epd7in3e.logic import compute_label_layout
+			font_size, anchor, shadow_offset = compute_label_layout(self.label_x_per, self.label_y_per, self.label_w_per, width, height)
+			self.label_font_size = font_size
+			self.label_anchor_x, self.label_anchor_y = anchor
+			self.label_shadow_x, self.label_shadow_y = shadow_offset
+		else:
+			# TODO: add other EPD types
+			self.clear_label_layout()
+
+	def clear_label_layout(self) -> None:
+		self.label_font_size = None
+		self.label_anchor_x = None
+		self.label_anchor_y = None
+		self.label_shadow_x = None
+		self.label_shadow_y = None
+
 
 class WallpaperOwnershipModel(db.Model):
 	__tablename__: str = "wallpaper_ownership"
@@ -0,0 +1,125 @@
+import hashlib
+import os
+
+from logging import Logger, getLogger
+from typing import Iterable
+
+from sqlalchemy import func, select
+
+from app import db
+from app.consts import DIR_APP_UPLOAD
+from app.epd7in3e.logic import forget_wallpaper_file
+
+from .models import WallpaperModel
+from .utils import StoredWallpaper
+
+
+logger: Logger = getLogger(__name__)
+
+
+'''
+Processed wallpapers are stored by content, the file name is the hash of the packed
+file (see store_image), so identical results share a single file. Every wallpaper row
+sharing a file name is a reference to it, the file is removed once the last of them is
+deleted.
+Rows also record the asset key of the source image and processing that produced them,
+an upload with a known asset key reuses that file instead of being processed again.
+Adding references (place_files) and dropping the last one (release_files) hold a
+per file name lock until their transaction ends, so a file is never removed while a row
+for it is being added.
+'''
+
+
+# Lock file_name until the end of the transaction, a postgres advisory lock. Other
+# databases (tests, SQLite) are not locked.
+def _lock_file(file_name: str) -> None:
+	if db.session.get_bind().dialect.name != "postgresql":
+		return
+	
+	key: int = int.from_bytes(hashlib.sha256(file_name.encode()).digest()[0:8], "big", signed=True)
+	db.session.execute(select(func.pg_advisory_xact_lock(key)))
+
+
+# (file name, hash, size) of a stored file for asset_key, like ingest_image returns,
+# None if there is none (anymore)
+def find_asset(asset_key: str) -> tuple[str, str, int] | None:
+	stmt = select(WallpaperModel).where(WallpaperModel.asset_key == asset_key).order_by(WallpaperModel.id).limit(1)
+	wallpaper: WallpaperModel | None = db.session.scalars(stmt).first()
+	if wallpaper is None or not os.path.isfile(os.path.join(DIR_APP_UPLOAD, wallpaper.file_name)):
+		return None
+	
+	logger.debug(f"Found asset {asset_key=} {wallpaper.file_name=}")
+	return wallpaper.file_name, wallpaper.hash, wallpaper.size
+
+
+# Put the files of new wallpapers in place, before their rows are committed in the same
+# transaction: staged files are moved under their file name (or dropped, if the same
+# content is already stored), reused files must still exist. Raises if one is gone.
+def place_files(files: Iterable[StoredWallpaper]) -> None:
+	# duplicates within a batch share the staged file of a single result
+	staged: dict[str, set[str]] = {}
+	for file in files:
+		staged.setdefault(file.file_name, set())
+		if file.staged_name is not None:
+			staged[file.file_name].add(file.staged_name)
+	
+	# always locked in the same order
+	for file_name in sorted(staged):
+		_lock_file(file_name)
+		
+		file_path: str = os.path.join(DIR_APP_UPLOAD, file_name)
+		for staged_name in sorted(staged[file_name]):
+			staged_path: str = os.path.join(DIR_APP_UPLOAD, staged_name)
+			
+			# the existing file may be mapped by a tick right now, keep it
+			if os.path.isfile(file_path):
+				os.remove(staged_path)
+			else:
+				os.replace(staged_path, file_path)
+		
+		if not os.path.isfile(file_path):
+			raise FileNotFoundError(f"Wallpaper file {file_name} is gone")
+
+
+# Remove the staged files of wallpapers that could not be added
+def discard_staged_files(files: Iterable[StoredWallpaper]) -> None:
+	for file in files:
+		if file.staged_name is None:
+			continue
+		
+		staged_path: str = os.path.join(DIR_APP_UPLOAD, file.staged_name)
+		if os.path.isfile(staged_path):
+			os.remove(staged_path)
+
+
+# Remove the files no wallpaper references anymore, call once the rows referencing them
+# are deleted (committed or rolled back)
+def release_files(file_names: Iterable[str]) -> None:
+	file_names = set(file_names)
+	if len(file_names) == 0:
+		return
+	
+	for file_name in sorted(file_names):
+		_lock_file(file_name)
+	
+	stmt = select(WallpaperModel.file_name, func.count()).where(WallpaperModel.file_name.in_(file_names)).group_by(WallpaperModel.file_name)
+	ref_counts: dict[str, int] = {file_name: count for file_name, count in db.session.execute(stmt).tuples()}
+	
+	for file_name in file_names:
+		if ref_counts.get(file_name, 0) > 0:
+			logger.debug(f"Keeping wallpaper file {file_name}, {ref_counts[file_name]} references left")
+			continue
+		
+		file_path: str = os.path.join(DIR_APP_UPLOAD, file_name)
+		forget_wallpaper_file(file_path)
+		if os.path.isfile(file_path):
+			try:
+				logger.info(f"Deleting file {file_path}")
+				os.remove(file_path)
+			except Exception as ex:
+				logger.error(f"Unable to delete wallpaper file due to {ex}")
+		else:
+			logger.error(f"Unable to find wallpaper file {file_name} in {file_path}")
+	
+	# ends the transaction, releasing the locks
+	db.session.commit()
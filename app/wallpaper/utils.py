@@ -1,23 +1,75 @@
+import hashlib
+import io
+import math
 import os
-import numpy as np
+import tempfile
 
 from logging import Logger, getLogger
+from typing import IO, NamedTuple, Sequence
 
 from PIL.Image import Image
 from PIL import Image as Img
-from PIL import ImageFilter
 
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
 from app.consts import *
 from app.lib.errors import api_abort, ErrorCode
-from app.wallpaper.consts import ALLOWED_EXTENSIONS
+from app.frame.consts import PACKED_EXTENSION
+from app.frame.packed import write_packed
+from app.wallpaper.consts import *
+
+from .dither import dither
+from .fill import fill_background
 
 
 logger: Logger = getLogger(__name__)
 
 
+# Everything the pipeline needs to turn an upload into a stored wallpaper for a device
+class IngestParams(NamedTuple):
+	canvas_size: tuple[int, int]
+	image_scale: float
+	image_offset: tuple[int, int]
+	palette: Sequence[tuple[int, int, int] | None]
+	dither_method: DitherMethod
+	background_fill: BackgroundFill
+	bpp: int
+	palette_id: int
+	panel_size: tuple[int, int]
+
+
+# A processed image in the upload dir, waiting for its wallpaper row
+class StoredWallpaper(NamedTuple):
+	name: str
+	source_hash: str
+	asset_key: str
+	file_name: str
+	hash: str
+	size: int
+	# where a newly processed file waits in the upload dir until it is put under file_name,
+	# None for a file that is already stored
+	staged_name: str | None = None
+
+
+# Key of the wallpaper file produced from the source image with source_hash and params,
+# everything that changes the result is part of it
+def get_asset_key(source_hash: str, params: IngestParams) -> str:
+	key: str = ":".join(str(value) for value in (
+		source_hash,
+		params.canvas_size,
+		params.image_scale,
+		params.image_offset,
+		params.dither_method.value,
+		params.background_fill.value,
+		params.bpp,
+		params.palette_id,
+		params.panel_size,
+		WALLPAPER_PIPELINE_VERSION,
+	))
+	return hashlib.sha256(key.encode()).hexdigest()
+
+
 def _crop(img: Image, size: tuple[int, int]) -> Image:
 	l: float = (img.width - size[0]) * 0.5
 	r: float = l + size[0]
@@ -27,128 +79,245 @@ def _crop(img: Image, size: tuple[int, int]) -> Image:
 	return img.crop((l, t, r, b))
 
 
-def get_new_val(old_val, nc):
-	return np.round(old_val * (nc - 1)) / (nc - 1)
-
-
-# Floyd-Steinberg dither the image img into a palette with nc colours per channel.
-# https://scipython.com/blog/floyd-steinberg-dithering/
-def _fs_dither(img: Image, nc: int) -> Image:
-	h: int = img.height
-	w: int = img.width
-	arr = np.array(img, dtype=float) / 255
-
-	for ir in range(h):
-		for ic in range(w):
-			# NB need to copy here for RGB arrays otherwise err will be (0,0,0)!
-			old_val = arr[ir, ic].copy()
-			new_val = get_new_val(old_val, nc)
-			arr[ir, ic] = new_val
-			err = old_val - new_val
-			# In this simple example, we will just ignore the border pixels.
-			if ic < w - 1:
-				arr[ir, ic + 1] += err * 7 / 16
-			if ir < h - 1:
-				if ic > 0:
-					arr[ir + 1, ic - 1] += err * 3 / 16
-				arr[ir + 1, ic] += err * 5 / 16
-				if ic < w - 1:
-					arr[ir + 1, ic + 1] += err / 16
+# Format and size of the image in fp from its header only, nothing is decoded. None if
+# fp is not an image. fp is rewound for the actual decode.
+def probe_image(fp: IO[bytes]) -> tuple[str, tuple[int, int]] | None:
+	try:
+		with Img.open(fp) as img:
+			return img.format or "", img.size
+	except Exception as ex:
+		logger.error(f"Failed to identify image: {ex}")
+		return None
+	finally:
+		fp.seek(0)
 
-	carr = np.array(arr / np.max(arr, axis=(0, 1)) * 255, dtype=np.uint8)
-	return Img.fromarray(carr)
 
+# Scale load_image decodes at, relative to the full image size
+def _load_scale(size: tuple[int, int], canvas_size: tuple[int, int], image_scale: float) -> float:
+	return max(canvas_size[0] / size[0], canvas_size[1] / size[1], (canvas_size[0] * image_scale) / size[0])
 
-# Simple palette reduction without dithering.
-def _palette_reduce(img: Image, nc: int) -> Image:
-	arr = np.array(img, dtype=float) / 255
-	arr = get_new_val(arr, nc)
 
-	carr = np.array(arr / np.max(arr) * 255, dtype=np.uint8)
-	return Img.fromarray(carr)
+# Rough peak memory of ingest_image for an image of format and size, for admission
+def estimate_ingest_bytes(format: str, size: tuple[int, int], params: IngestParams) -> int:
+	decoded_pixels: float = size[0] * size[1]
+	
+	# draft mode decodes JPEGs at 1/2, 1/4 or 1/8, at worst twice the scale needed
+	if format == "JPEG":
+		decoded_pixels *= min(1.0, max(1 / 8, 2 * _load_scale(size, params.canvas_size, params.image_scale))) ** 2
+	
+	canvas_pixels: int = params.canvas_size[0] * params.canvas_size[1]
+	return int(decoded_pixels * INGEST_BYTES_PER_DECODED_PIXEL + canvas_pixels * INGEST_BYTES_PER_CANVAS_PIXEL)
 
 
-def validate_image(file_path: str) -> bool:
+# Open and decode the upload (a path or a seekable stream) once, at no more than the resolution process_image needs:
+# large enough to cover canvas_size and for the foreground at image_scale.
+# JPEGs are decoded at a reduced scale (draft mode), other formats are reduced by a
+# whole factor right after decoding. Decoding is also the validation, returns None if
+# the file is not a (complete) image.
+def load_image(fp: str | IO[bytes], canvas_size: tuple[int, int], image_scale: float) -> Image | None:
 	try:
-		img: Image = Img.open(file_path)
-		img.verify()
-		return True
-	except Exception as ex:
-		logger.error(f"Failed to validate image: {ex}")
-		return False
+		img: Image = Img.open(fp)
+		w: int = img.width
+		h: int = img.height
+		
+		# same ratios as process_image, the larger one decides
+		scale: float = _load_scale((w, h), canvas_size, image_scale)
+		if scale < 1:
+			img.draft("RGB", (math.ceil(w * scale), math.ceil(h * scale)))
 		
+		img.load()
+		
+		factor: int = int(min(img.width / (w * scale), img.height / (h * scale)))
+		if factor > 1:
+			img = img.reduce(factor)
+		
+		logger.debug(f"Loaded image {w=} {h=} {scale=} {img.size=}")
+		return img
+	
+	except Exception as ex:
+		logger.error(f"Failed to load image: {ex}")
+		return None
+
 
+# Dithered canvas of panel color indices for image, None if processing failed
 def process_image(
-	file_path: str,
-	dest_path: str,
+	image: Image,
 	canvas_size: tuple[int, int],
 	image_scale: float,
 	image_offset: tuple[int, int],
-	nc: int,
-	del_src: bool = True,
-) -> bool:
+	palette: Sequence[tuple[int, int, int] | None],
+	dither_method: DitherMethod,
+	background_fill: BackgroundFill = DEFAULT_BACKGROUND_FILL,
+) -> Image | None:
 	try:
-		canvas: Image = Img.new("RGB", canvas_size)
-		bg: Image = Img.open(file_path)
-		fg: Image = Img.open(file_path)
-
-		w: int = bg.width
-		h: int = bg.height
-
-		# Resize bg to fill the entire canvas
-		# According to orientation
-		bg_ratio: float = max(canvas_size[0] / w, canvas_size[1] / h)
-		bg = bg.resize(size=(int(w * bg_ratio), int(h * bg_ratio)), resample=Img.Resampling.LANCZOS)
-		#bg.thumbnail((w * bg_ratio, h * bg_ratio), Img.Resampling.LANCZOS)
+		w: int = image.width
+		h: int = image.height
 
 		# Resize foreground image to user specified percentage scale
 		# image_scale represents the the image width as a percent of canvas width (fixed size)
-		true_scale: float = (canvas_size[0] * image_scale) / fg.width
+		true_scale: float = (canvas_size[0] * image_scale) / w
 		
-		fg.thumbnail(
-			(int(fg.width * true_scale), int(fg.height * true_scale)),
-			Img.Resampling.LANCZOS,
-		)
-
-		# Apply gaussian blur to bg
-		bg = bg.filter(ImageFilter.GaussianBlur(radius=4))
-
-		# Centralize bg after resizing
-		bg_offset_x: int = 0
-		bg_offset_y: int = 0
-		if bg.width > canvas.width:
-			bg_offset_x = int((bg.width - canvas.width) * 0.5)
-			
-		if bg.height > canvas.height:
-			bg_offset_y = int((bg.height - canvas.height) * 0.5)
-		
-		canvas.paste(bg, (-bg_offset_x, -bg_offset_y))
+		# only ever shrunk (like thumbnail), straight from the decoded image without a copy
+		fg: Image = image
+		if true_scale < 1:
+			fg = image.resize(size=(max(1, int(w * true_scale)), max(1, int(h * true_scale))), resample=Img.Resampling.LANCZOS)
+
+		# Fill the entire canvas around the foreground
+		canvas: Image = fill_background(image, fg, image_offset, canvas_size, background_fill)
 
 		# Paste fg to canvas with user specified offsets
 		canvas.paste(fg, image_offset)
 
-		# Apply fyold steinburg dithering
-		canvas = _fs_dither(canvas, nc)
-
-		# Reduce palette color
-		canvas = _palette_reduce(canvas, nc)
+		# Dither onto the panel palette, the result holds the panel color indices
+		return dither(canvas, palette, dither_method)
 
-		# Save file
-		canvas.save(dest_path)
+	except (IOError, ValueError) as error:
+		logger.error(f"Unable to process image: {error}")
+		return None
+
+
+# Passes writes through to f, hashing the bytes on the way
+class HashingWriter:
+	def __init__(self, f: IO[bytes]) -> None:
+		self.f: IO[bytes] = f
+		self.hash = hashlib.sha256()
+		self.size: int = 0
+
+	def write(self, data: bytes) -> int:
+		self.hash.update(data)
+		self.size += len(data)
+		return self.f.write(data)
+
+
+# Write canvas packed in panel order (so it is ready to be sent as is) into dest_dir,
+# returns the (file name, sha256 of the file, file size, staged name).
+# The file is hashed while it is written and left complete under the staged (temp) name
+# in dest_dir. The file name is the hash, identical results are stored once, the file
+# is only put under it along with its wallpaper row (see store.place_files), so a file
+# in use is never replaced or removed from under it.
+def store_image(
+	canvas: Image,
+	dest_dir: str,
+	bpp: int,
+	palette_id: int,
+	panel_size: tuple[int, int],
+) -> tuple[str, str, int, str]:
+	os.makedirs(dest_dir, exist_ok=True)
+	
+	fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=dest_dir)
+	try:
+		with os.fdopen(fd, "wb") as f:
+			writer: HashingWriter = HashingWriter(f)
+			write_packed(writer, canvas, bpp, palette_id, WALLPAPER_PIPELINE_VERSION, panel_size)	# type: ignore
+			f.flush()
+			os.fsync(f.fileno())
 		
-		logger.debug(f"Image saved. {canvas.width=} {canvas.height=}")
+		hash: str = writer.hash.hexdigest()
+		file_name: str = f"{hash}{PACKED_EXTENSION}"
+	
+	except BaseException:
+		if os.path.isfile(temp_path):
+			os.remove(temp_path)
+		raise
+	
+	logger.debug(f"Image saved. {file_name=} {canvas.width=} {canvas.height=} {writer.size=}")
+	return file_name, hash, writer.size, os.path.basename(temp_path)
+
+
+# Whole upload pipeline (load, process, store) for an encoded image file, returns the
+# (file name, hash, size, staged name) of the stored wallpaper.
+# Module level and free of app state so it can run in a worker process.
+def ingest_image(data: bytes, params: IngestParams, dest_dir: str) -> tuple[str, str, int, str]:
+	image: Image | None = load_image(io.BytesIO(data), params.canvas_size, params.image_scale)
+	if image is None:
+		raise ValueError("Invalid image file")
+	
+	canvas: Image | None = process_image(
+		image=image,
+		canvas_size=params.canvas_size,
+		image_scale=params.image_scale,
+		image_offset=params.image_offset,
+		palette=params.palette,
+		dither_method=params.dither_method,
+		background_fill=params.background_fill,
+	)
+	if canvas is None:
+		raise ValueError("Unable to process image")
+	
+	return store_image(canvas, dest_dir, params.bpp, params.palette_id, params.panel_size)
 
-		if del_src:
-			os.remove(file_path)
 
-		return True
+# ingest_image for a file on disk, read by the worker itself so only the path is sent to it
+def ingest_image_file(path: str, params: IngestParams, dest_dir: str) -> tuple[str, str, int, str]:
+	with open(path, "rb") as f:
+		return ingest_image(f.read(), params, dest_dir)
 
-	except IOError as error:
-		logger.error(f"Unable to process image: {error}")
-		return False
+
+# sha256 of the file at path, read in chunks
+def hash_file(path: str) -> str:
+	source_hash = hashlib.sha256()
+	with open(path, "rb") as f:
+		while chunk := f.read(HASH_CHUNK_SIZE):
+			source_hash.update(chunk)
+	
+	return source_hash.hexdigest()
+
+
+# (sha256, size) of the file at path, or the error if it cannot be read, so one unreadable
+# file does not fail a whole batch of them
+def hash_source_file(path: str) -> tuple[str, int] | OSError:
+	try:
+		return hash_file(path), os.path.getsize(path)
+	except OSError as ex:
+		return ex
 
 
-def save_upload_file(file: FileStorage | None) -> str:
+def is_background_fill_valid(background_fill: str | None) -> str | None:
+	if background_fill is None:
+		return "This is a required property."
+	
+	if background_fill not in BackgroundFill.__members__:
+		return "Unsupported background fill."
+	
+	return None
+
+
+def is_upload_file_valid(file: FileStorage | None) -> str | None:
+	if file is None:
+		return "This is a required property."
+	
+	file_name: str | None = file.filename
+	if file_name is None or len(file_name) == 0:
+		return "Invalid input."
+	
+	if "." not in file_name or file_name.rsplit(".", 1)[1].lower() not in ALLOWED_EXTENSIONS:
+		return "Invalid file extension."
+	
+	return None
+
+
+# Stream the uploaded file into a new file in dest_dir, returns the (path, sha256, size)
+# of it
+def save_upload_file(file: FileStorage, dest_dir: str) -> tuple[str, str, int]:
+	os.makedirs(dest_dir, exist_ok=True)
+	
+	fd, path = tempfile.mkstemp(suffix=UPLOAD_SOURCE_SUFFIX, dir=dest_dir)
+	try:
+		with os.fdopen(fd, "wb") as f:
+			writer: HashingWriter = HashingWriter(f)
+			while chunk := file.stream.read(HASH_CHUNK_SIZE):
+				writer.write(chunk)
+	
+	except BaseException:
+		os.remove(path)
+		raise
+	
+	return path, writer.hash.hexdigest(), writer.size
+
+
+# Validate the uploaded file and return its secured name, the file is decoded straight
+# from the request stream so it is never saved as is
+def check_upload_file(file: FileStorage | None) -> str:
 	# Check for file in request.files
 	if file is None:
 		api_abort(ErrorCode.INVALID_INPUT, errors={"file":"This is a required property"})
@@ -165,15 +334,4 @@ def save_upload_file(file: FileStorage | None) -> str:
 		api_abort(ErrorCode.UNSUPPORTED_MEDIA_TYPE, detail="Invalid file extension")
 		
 	# secure file name
-	secured_file_name: str = secure_filename(file_name)
-
-	# save file to temp dir
-	# TODO: improve location of "uploaded" files so that it doesn't get
-	# overwritten by someone else uploading the files with same file name at the same time
-	if not os.path.isdir(DIR_TMP_UPLOAD):
-		os.mkdir(DIR_TMP_UPLOAD)
-
-	temp_path: str = os.path.join(DIR_TMP_UPLOAD, secured_file_name)
-	file.save(temp_path)
-	
-	return secured_file_name
+	return secure_filename(file_name)
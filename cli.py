@@ -1,16 +1,20 @@
+import click
 import json
 import os
 import getpass
 import logging
 from logging import Logger, getLogger
 import socket
+import time
 
 from app import create_app
 from app.device.consts import Orientation
 from app.device.logic import create_device
+from app.frame.codecs import CODECS
 from app.schedule.logic import create_schedule
 from app.user.consts import UserRole
 from app.user.logic import create_user
+from app.wallpaper.consts import BackgroundFill, DEFAULT_BACKGROUND_FILL
 
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s <%(levelname)s> %(name)s.%(funcName)s: %(message)s")
 logger: Logger = getLogger(__name__)
@@ -106,3 +110,231 @@ def cli_setup_test_data() -> None:
 		logger.info(f"{schedule_payloads=}")
 		for schedule in schedule_payloads:
 			create_schedule(schedule["userId"], schedule["deviceId"], schedule)
+
+
+@app.cli.command("bench-codecs")
+@click.option("--repeat", default=5, show_default=True, help="Runs per codec and frame, the best run is reported")
+def cli_bench_codecs(repeat: int) -> None:
+	from PIL import Image as PImg
+	from app.consts import DIR_TEST_IMG
+	from app.epd7in3e.consts import EPD_DIMENSIONS
+	from app.epd7in3e.logic import convert_image_to_buffer, convert_image_to_indexed
+	
+	# frames exactly as they are sent to the panel
+	frames: list[tuple[str, bytes]] = []
+	for file_name in sorted(os.listdir(DIR_TEST_IMG)):
+		try:
+			image = PImg.open(os.path.join(DIR_TEST_IMG, file_name))
+		except Exception:
+			continue
+		
+		if image.size not in (EPD_DIMENSIONS, EPD_DIMENSIONS[::-1]):
+			logger.info(f"Skipping {file_name}, unexpected size {image.size}")
+			continue
+		
+		frames.append((file_name, convert_image_to_buffer(convert_image_to_indexed(image))))
+	
+	if len(frames) == 0:
+		logger.error(f"No frames found in {DIR_TEST_IMG}")
+		return
+	
+	click.echo(f"{'frame':<24}{'codec':<8}{'bytes':>10}{'ratio':>8}{'encode ms':>12}{'decode ms':>12}")
+	for file_name, buffer in frames:
+		for codec, (encode, decode) in CODECS.items():
+			encode_times: list[float] = []
+			decode_times: list[float] = []
+			for _ in range(repeat):
+				start: float = time.perf_counter()
+				encoded: bytes = encode(buffer)
+				encode_times.append(time.perf_counter() - start)
+				
+				start = time.perf_counter()
+				decoded: bytes = decode(encoded)
+				decode_times.append(time.perf_counter() - start)
+			
+			if decoded != buffer:
+				logger.error(f"{codec.name} did not round trip {file_name}")
+			
+			click.echo(f"{file_name:<24}{codec.name:<8}{len(encoded):>10}{len(buffer) / len(encoded):>8.2f}{min(encode_times) * 1000:>12.2f}{min(decode_times) * 1000:>12.2f}")
+
+
+@app.cli.command("convert-wallpapers")
+@click.option("--keep-src", is_flag=True, help="Keep the original BMP files after converting")
+def cli_convert_wallpapers(keep_src: bool) -> None:
+	import hashlib
+	from PIL import Image as PImg
+	from sqlalchemy import select
+	from app import db
+	from app.consts import DIR_APP_UPLOAD
+	from app.epd7in3e.consts import EPD_BPP, EPD_DIMENSIONS, EPD_PALETTE_ID
+	from app.epd7in3e.logic import convert_image_to_indexed, forget_wallpaper_file
+	from app.frame.consts import PACKED_EXTENSION
+	from app.frame.packed import is_packed_file, write_packed_file
+	from app.wallpaper.consts import WALLPAPER_PIPELINE_VERSION
+	from app.wallpaper.models import WallpaperModel
+	from app.wallpaper.store import release_files
+	
+	# rewrite the BMP wallpapers stored before the packed format, in place of re-uploading them
+	models = db.session.scalars(select(WallpaperModel)).all()
+	for model in models:
+		if is_packed_file(model.file_name):
+			continue
+		
+		src_path: str = os.path.join(DIR_APP_UPLOAD, model.file_name)
+		if not os.path.isfile(src_path):
+			logger.warning(f"Skipping {model.id=}, file not found {src_path=}")
+			continue
+		
+		file_name: str = f"{os.path.splitext(model.file_name)[0]}{PACKED_EXTENSION}"
+		dest_path: str = os.path.join(DIR_APP_UPLOAD, file_name)
+		try:
+			with PImg.open(src_path) as image:
+				write_packed_file(dest_path, convert_image_to_indexed(image), EPD_BPP, EPD_PALETTE_ID, WALLPAPER_PIPELINE_VERSION, EPD_DIMENSIONS)
+		except (IOError, ValueError) as error:
+			logger.error(f"Unable to convert {src_path=}: {error}")
+			if os.path.isfile(dest_path):
+				os.remove(dest_path)
+			continue
+		
+		with open(dest_path, "rb") as f:
+			model.hash = hashlib.sha256(f.read()).hexdigest()
+		model.file_name = file_name
+		model.size = os.path.getsize(dest_path)
+		db.session.commit()
+		
+		logger.info(f"Converted {src_path=} to {dest_path=} ({model.size} bytes)")
+		forget_wallpaper_file(src_path)
+		if not keep_src:
+			release_files([os.path.basename(src_path)])
+
+
+@app.cli.command("import-wallpapers")
+@click.option("--device", "device_id", type=int, required=True, help="Device to import the wallpapers to")
+@click.option("--user", "user_id", type=int, default=None, help="Owner of the wallpapers, defaults to the first owner of the device")
+@click.option("--workers", type=int, default=os.cpu_count() or 1, show_default=True, help="Worker processes")
+@click.option("--img-scale", type=float, default=1.0, show_default=True, help="Image width as a fraction of the canvas width")
+@click.option("--x-pos", type=float, default=0.0, show_default=True, help="Image x offset as a fraction of the canvas width")
+@click.option("--y-pos", type=float, default=0.0, show_default=True, help="Image y offset as a fraction of the canvas height")
+@click.option("--bg-fill", type=click.Choice([bf.value for bf in BackgroundFill]), default=DEFAULT_BACKGROUND_FILL.value, show_default=True, help="Background fill")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+def cli_import_wallpapers(
+	device_id: int,
+	user_id: int | None,
+	workers: int,
+	img_scale: float,
+	x_pos: float,
+	y_pos: float,
+	bg_fill: str,
+	directory: str
+) -> None:
+	from concurrent.futures import Future, as_completed
+	from sqlalchemy import select
+	from werkzeug.utils import secure_filename
+	from app import db
+	from app.consts import DIR_APP_UPLOAD
+	from app.device.models import DeviceModel, DeviceOwnershipModel
+	from app.wallpaper.consts import ALLOWED_EXTENSIONS
+	from app.wallpaper.jobs import create_pool
+	from app.wallpaper.logic import add_wallpapers, get_ingest_params
+	from app.wallpaper.models import WallpaperModel, WallpaperOwnershipModel
+	from app.wallpaper.store import find_asset
+	from app.wallpaper.utils import StoredWallpaper, get_asset_key, hash_source_file, ingest_image_file
+	
+	device: DeviceModel | None = db.session.get(DeviceModel, device_id)
+	if device is None:
+		raise click.ClickException(f"Device {device_id} not found")
+	
+	if user_id is None:
+		user_id = db.session.scalars(select(DeviceOwnershipModel.user_id).where(DeviceOwnershipModel.device_id == device_id).order_by(DeviceOwnershipModel.id)).first()
+		if user_id is None:
+			raise click.ClickException(f"Device {device_id} has no owner, use --user")
+	
+	paths: list[str] = sorted(
+		os.path.join(root, file_name)
+		for root, _, file_names in os.walk(directory)
+		for file_name in file_names
+		if "." in file_name and file_name.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+	)
+	if len(paths) == 0:
+		click.echo(f"No images found in {directory}")
+		return
+	
+	# source images already on the device, files imported before or uploaded
+	imported: set[str | None] = set(db.session.scalars(
+		select(WallpaperModel.source_hash)
+		.join(WallpaperOwnershipModel, WallpaperOwnershipModel.wallpaper_id == WallpaperModel.id)
+		.where(WallpaperOwnershipModel.device_id == device_id)
+	).all())
+	
+	params = get_ingest_params(device, img_scale, x_pos, y_pos, BackgroundFill[bg_fill])
+	stored: list[StoredWallpaper] = []
+	reused: int = 0
+	skipped: int = 0
+	failed: int = 0
+	start: float = time.perf_counter()
+	
+	pool = create_pool(workers)
+	try:
+		# hash everything first, so files already imported (or found twice) are never processed
+		todo: list[tuple[str, str]] = []
+		source_sizes: dict[str, int] = {}
+		with click.progressbar(pool.map(hash_source_file, paths, chunksize=16), length=len(paths), label="Hashing") as hashes:
+			for path, hashed in zip(paths, hashes):
+				if isinstance(hashed, OSError):
+					failed += 1
+					logger.error(f"Unable to read {path=}: {hashed}")
+					continue
+				
+				source_hash, source_sizes[path] = hashed
+				if source_hash in imported:
+					skipped += 1
+					continue
+				
+				imported.add(source_hash)
+				todo.append((path, source_hash))
+		
+		def stored_wallpaper(path: str, source_hash: str, result: tuple) -> StoredWallpaper:
+			name: str = secure_filename(os.path.basename(path)).rsplit(".", 1)[0] or source_hash[0:8]
+			return StoredWallpaper(name, source_hash, get_asset_key(source_hash, params), *result)
+		
+		# images already processed the same way for another device are reused as they are
+		to_process: list[tuple[str, str]] = []
+		for path, source_hash in todo:
+			asset: tuple[str, str, int] | None = find_asset(get_asset_key(source_hash, params))
+			if asset is None:
+				to_process.append((path, source_hash))
+			else:
+				reused += 1
+				stored.append(stored_wallpaper(path, source_hash, asset))
+		
+		source_bytes: int = sum(source_sizes[path] for path, _ in to_process)
+		ingest_start: float = time.perf_counter()
+		
+		submitted: dict[Future, tuple[str, str]] = {
+			pool.submit(ingest_image_file, path, params, DIR_APP_UPLOAD): (path, source_hash)
+			for path, source_hash in to_process
+		}
+		with click.progressbar(as_completed(submitted), length=len(submitted), label="Importing") as completed:
+			for future in completed:
+				path, source_hash = submitted[future]
+				try:
+					stored.append(stored_wallpaper(path, source_hash, future.result()))
+				except Exception as ex:
+					failed += 1
+					logger.error(f"Unable to import {path=}: {ex}")
+	
+	finally:
+		pool.shutdown(cancel_futures=True)
+	
+	ingest_time: float = time.perf_counter() - ingest_start
+	
+	# rows in one transaction, in directory order
+	order: dict[str, int] = {source_hash: index for index, (_, source_hash) in enumerate(todo)}
+	stored.sort(key=lambda wallpaper: order[wallpaper.source_hash])
+	wallpaper_ids: list[int] = add_wallpapers(user_id, device_id, stored) if len(stored) > 0 else []
+	
+	total_time: float = time.perf_counter() - start
+	click.echo(
+		f"Imported {len(wallpaper_ids)} ({reused} reused), skipped {skipped}, failed {failed} of {len(paths)} files in {total_time:.1f} s "
+		f"({len(to_process) / max(ingest_time, 1e-9):.2f} images/s, {source_bytes / (1024 * 1024) / max(ingest_time, 1e-9):.1f} MB/s with {workers} workers)"
+	)
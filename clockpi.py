@@ -16,7 +16,7 @@ import waitress
 import werkzeug
 import werkzeug.exceptions
 
-from app import api, api_bp, auth, background, device, session_pkg, user
+from app import api, api_bp, auth, background, device, frame, session_pkg, user, wallpaper
 from app import create_app, redis_controller
 
 
@@ -36,12 +36,15 @@ app.register_blueprint(api_bp)
 auth.append_namespace(api)
 background.append_namespace(api)
 device.append_namespace(api)
+frame.append_namespace(api)
 session_pkg.append_namespace(api)
 user.append_namespace(api)
 
 
 # Redis
 redis_controller.init_app(app)
+frame.init_app(app)
+wallpaper.init_app(app)
 #redis_controller.sub_to_channel()
 
 
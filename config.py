@@ -7,6 +7,18 @@ class Config:
 	SQLALCHEMY_TRACK_MODIFICATIONS: bool = False
 	SESSION_TYPE:str = "sqlalchemy"
 	PROPAGATE_EXCEPTIONS: bool = True
+	FRAME_CACHE_MAX_BYTES: int = int(os.getenv("FRAME_CACHE_MAX_BYTES", 8 * 1024 * 1024)) # 8 MB
+	FRAME_CACHE_REDIS_ENABLED: bool = os.getenv("FRAME_CACHE_REDIS_ENABLED", "0") == "1"
+	FRAME_CACHE_REDIS_TTL: int = int(os.getenv("FRAME_CACHE_REDIS_TTL", 120)) # seconds
+	FRAME_PRERENDER_MINUTES: int = int(os.getenv("FRAME_PRERENDER_MINUTES", 2))
+	FRAME_DELTA_KEYFRAME_INTERVAL: int = int(os.getenv("FRAME_DELTA_KEYFRAME_INTERVAL", 30))
+	FRAME_BINARY_TRANSPORT: bool = os.getenv("FRAME_BINARY_TRANSPORT", "0") == "1"
+	WALLPAPER_BATCH_MAX_CONTENT_LENGTH: int = int(os.getenv("WALLPAPER_BATCH_MAX_CONTENT_LENGTH", 512 * 1024 * 1024)) # 512 MB
+	WALLPAPER_JOB_WORKERS: int = int(os.getenv("WALLPAPER_JOB_WORKERS", 2))
+	WALLPAPER_ADMISSION_MAX_JOBS: int = int(os.getenv("WALLPAPER_ADMISSION_MAX_JOBS", os.cpu_count() or 1))
+	WALLPAPER_ADMISSION_MAX_BYTES: int = int(os.getenv("WALLPAPER_ADMISSION_MAX_BYTES", 256 * 1024 * 1024)) # 256 MB
+	WALLPAPER_ADMISSION_WAIT: float = float(os.getenv("WALLPAPER_ADMISSION_WAIT", 5.0)) # seconds
+	WALLPAPER_CACHE_MAX_BYTES: int = int(os.getenv("WALLPAPER_CACHE_MAX_BYTES", 8 * 1024 * 1024)) # 8 MB
 
 
 class DevConfig(Config):
@@ -14,6 +26,7 @@ class DevConfig(Config):
 	SECRET_KEY: str = "dev"
 	SQLALCHEMY_DATABASE_URI: str = os.getenv("DATABASE_URL", "postgresql://localhost/clockpi")
 	REDIS_URL: str = os.getenv("REDIS_URL", "redis://:@localhost/0")
+	REDIS_BINARY_URL: str = os.getenv("REDIS_BINARY_URL", REDIS_URL)
 
 
 class ProdConfig(Config):
@@ -21,3 +34,4 @@ class ProdConfig(Config):
 	SECRET_KEY: str | None = os.getenv("SECRET_KEY")
 	SQLALCHEMY_DATABASE_URI: str | None = os.getenv("DATABASE_URL")
 	REDIS_URL: str | None = os.getenv("REDIS_URL")
+	REDIS_BINARY_URL: str | None = os.getenv("REDIS_BINARY_URL", REDIS_URL)
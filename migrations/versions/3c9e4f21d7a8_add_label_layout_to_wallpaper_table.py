@@ -0,0 +1,34 @@
+"""add label layout to wallpaper table
+
+Revision ID: 3c9e4f21d7a8
+Revises: 61e37ca54446
+Create Date: 2026-10-18 10:05:17.284913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e4f21d7a8'
+down_revision = '61e37ca54446'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('wallpaper', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('label_font_size', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('label_anchor_x', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('label_anchor_y', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('label_shadow_x', sa.Float(precision=1), nullable=True))
+        batch_op.add_column(sa.Column('label_shadow_y', sa.Float(precision=1), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('wallpaper', schema=None) as batch_op:
+        batch_op.drop_column('label_shadow_y')
+        batch_op.drop_column('label_shadow_x')
+        batch_op.drop_column('label_anchor_y')
+        batch_op.drop_column('label_anchor_x')
+        batch_op.drop_column('label_font_size')
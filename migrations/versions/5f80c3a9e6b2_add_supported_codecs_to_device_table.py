@@ -0,0 +1,26 @@
+"""add 'supported_codecs' to device table
+
+Revision ID: 5f80c3a9e6b2
+Revises: 9d2b7e5a1c43
+Create Date: 2026-10-18 12:03:44.158230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f80c3a9e6b2'
+down_revision = '9d2b7e5a1c43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('device', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('supported_codecs', sa.ARRAY(sa.String()), server_default='{ZLIB}', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('device', schema=None) as batch_op:
+        batch_op.drop_column('supported_codecs')
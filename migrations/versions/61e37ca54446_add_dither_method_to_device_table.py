@@ -0,0 +1,34 @@
+"""add 'dither_method' to device table
+
+Revision ID: 61e37ca54446
+Revises: b1a345671741
+Create Date: 2026-10-18 09:12:41.532108
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '61e37ca54446'
+down_revision = 'b1a345671741'
+branch_labels = None
+depends_on = None
+
+
+dithermethod = postgresql.ENUM('FLOYD_STEINBERG', 'ATKINSON', 'SIERRA_LITE', 'BAYER', 'NEAREST', name='dithermethod')
+
+
+def upgrade():
+    dithermethod.create(op.get_bind(), checkfirst=True)
+
+    with op.batch_alter_table('device', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('dither_method', dithermethod, server_default='FLOYD_STEINBERG', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('device', schema=None) as batch_op:
+        batch_op.drop_column('dither_method')
+
+    dithermethod.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,26 @@
+"""add 'is_delta_enabled' to device table
+
+Revision ID: 9d2b7e5a1c43
+Revises: 3c9e4f21d7a8
+Create Date: 2026-10-18 11:21:09.617204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2b7e5a1c43'
+down_revision = '3c9e4f21d7a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('device', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_delta_enabled', sa.Boolean(), server_default='f', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('device', schema=None) as batch_op:
+        batch_op.drop_column('is_delta_enabled')
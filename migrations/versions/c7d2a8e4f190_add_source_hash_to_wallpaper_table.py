@@ -0,0 +1,28 @@
+"""add 'source_hash' to wallpaper table
+
+Revision ID: c7d2a8e4f190
+Revises: 5f80c3a9e6b2
+Create Date: 2026-10-18 16:22:09.513847
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2a8e4f190'
+down_revision = '5f80c3a9e6b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('wallpaper', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('source_hash', sa.String(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_wallpaper_source_hash'), ['source_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('wallpaper', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_wallpaper_source_hash'))
+        batch_op.drop_column('source_hash')
@@ -0,0 +1,30 @@
+"""add 'asset_key' to wallpaper table
+
+Revision ID: e3a61f0b9d57
+Revises: c7d2a8e4f190
+Create Date: 2026-10-18 17:48:31.902614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a61f0b9d57'
+down_revision = 'c7d2a8e4f190'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('wallpaper', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('asset_key', sa.String(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_wallpaper_asset_key'), ['asset_key'], unique=False)
+        batch_op.create_index(batch_op.f('ix_wallpaper_file_name'), ['file_name'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('wallpaper', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_wallpaper_file_name'))
+        batch_op.drop_index(batch_op.f('ix_wallpaper_asset_key'))
+        batch_op.drop_column('asset_key')